@@ -2,19 +2,34 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
-from flask import Flask, send_from_directory
-from sqlalchemy import inspect, text
+from flask import Flask, jsonify, send_from_directory
+from flask_migrate import upgrade as upgrade_schema
 
 from extensions import cors, db, login_manager, migrate
 from models import *  # noqa: F401,F403
 from modules.admin import bp as admin_bp
 from modules.announcements import bp as announcements_bp
 from modules.auth import bp as auth_bp
+from modules.health import bp as health_bp
 from modules.koculator import bp as koculator_bp
 from modules.mymo import bp as mymo_bp
 from modules.password_resets import bp as password_resets_bp
 from modules.profile import bp as profile_bp
 from modules.toolbox import bp as toolbox_bp
+from assets import send_built_asset
+from avatars import migrate_data_url_avatars
+from cache import init_cache
+from compression import init_compression
+from db_profiles import engine_options, init_engine_profiles
+from db_routing import copy_sqlite_replicas, init_replicas, replica_binds
+from notes_io import fail_interrupted_imports
+from stats import ensure_stats, rebuild_stats, user_registered
+from passwords import PasswordHasherBusy, password_hasher
+from search import ensure_search_index, resolve_search_backend
+from tools.koculator import Limits as KoculatorLimits
+from tools.koculator import configure_cache as configure_koculator_cache
+from tools.koculator import configure_limits as configure_koculator_limits
+from user_cache import user_cache
 
 load_dotenv()
 
@@ -22,19 +37,148 @@ BASE_DIR = Path(__file__).resolve().parent
 FRONTEND_DIR = BASE_DIR.parent / "frontend"
 
 
+def password_hasher_busy(_exc):
+    # 哈希进程池排满时快速失败，让客户端稍后重试
+    response = jsonify(error="Server busy, please retry")
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
 def create_app():
     app = Flask(__name__, static_folder=None)
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev")
     default_sqlite = f"sqlite:///{(BASE_DIR / 'instance' / 'memo.db').as_posix()}"
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("SQLALCHEMY_DATABASE_URI", default_sqlite)
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # auto / sqlite / mysql / none，见 db_profiles.py
+    app.config["DB_ENGINE_PROFILE"] = os.getenv("DB_ENGINE_PROFILE", "auto")
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    app.config["SQLITE_SYNCHRONOUS"] = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    app.config["SQLITE_MMAP_SIZE"] = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    app.config["SQLITE_CACHE_SIZE_KB"] = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+    app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", "10"))
+    app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    app.config["DB_POOL_TIMEOUT"] = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # 小于 MySQL 的 wait_timeout，连接在被服务端断开前就回收
+    app.config["DB_POOL_RECYCLE"] = int(os.getenv("DB_POOL_RECYCLE", "280"))
+    app.config["DB_POOL_PRE_PING"] = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config, app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    # 只读副本，逗号分隔；为空时所有查询都走主库
+    replica_uris = [uri.strip() for uri in os.getenv("SQLALCHEMY_REPLICA_URIS", "").split(",") if uri.strip()]
+    app.config["SQLALCHEMY_BINDS"] = {
+        bind: {"url": uri, **engine_options(app.config, uri)}
+        for bind, uri in replica_binds(replica_uris).items()
+    }
+    # round_robin / least_loaded（借出连接最少的副本）
+    app.config["DB_REPLICA_STRATEGY"] = os.getenv("DB_REPLICA_STRATEGY", "round_robin")
+    app.config["DB_REPLICA_STICKY_SECONDS"] = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+    # auto / fts5 / mysql / like，auto 按数据库类型自动选择
+    app.config["NOTE_SEARCH_BACKEND"] = os.getenv("NOTE_SEARCH_BACKEND", "auto")
+    app.config["USER_CACHE_SIZE"] = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    app.config["USER_CACHE_TTL"] = float(os.getenv("USER_CACHE_TTL", "30"))
+    # 0：每个请求都核对一次版本号（一条主键查询），停用账号在所有 worker 上提交后立即生效；
+    # 调大可省掉这条查询，代价是其他 worker 最多晚这么多秒才发现变更
+    app.config["USER_CACHE_SYNC_INTERVAL"] = float(os.getenv("USER_CACHE_SYNC_INTERVAL", "0"))
+    app.config["KOCULATOR_CACHE_SIZE"] = int(os.getenv("KOCULATOR_CACHE_SIZE", "1024"))
+    app.config["KOCULATOR_BATCH_MAX_ITEMS"] = int(os.getenv("KOCULATOR_BATCH_MAX_ITEMS", "5000"))
+    app.config["KOCULATOR_BATCH_MAX_BYTES"] = int(os.getenv("KOCULATOR_BATCH_MAX_BYTES", str(1024 * 1024)))
+    app.config["KOCULATOR_BATCH_WORKERS"] = int(
+        os.getenv("KOCULATOR_BATCH_WORKERS", str(min(4, os.cpu_count() or 1)))
+    )
+    app.config["KOCULATOR_PARALLEL_THRESHOLD"] = int(os.getenv("KOCULATOR_PARALLEL_THRESHOLD", "256"))
+    app.config["KOCULATOR_VECTOR_MAX_LEN"] = int(os.getenv("KOCULATOR_VECTOR_MAX_LEN", "100000"))
+    # 单个表达式的成本上限，分词时检查
+    app.config["KOCULATOR_MAX_LENGTH"] = int(os.getenv("KOCULATOR_MAX_LENGTH", "1000"))
+    app.config["KOCULATOR_MAX_TOKENS"] = int(os.getenv("KOCULATOR_MAX_TOKENS", "500"))
+    app.config["KOCULATOR_MAX_DEPTH"] = int(os.getenv("KOCULATOR_MAX_DEPTH", "50"))
+    app.config["KOCULATOR_MAX_OPERAND_DIGITS"] = int(os.getenv("KOCULATOR_MAX_OPERAND_DIGITS", "50"))
+    app.config["KOCULATOR_PRECISION"] = int(os.getenv("KOCULATOR_PRECISION", "28"))
+    app.config["KOCULATOR_MAX_EXPONENT"] = int(os.getenv("KOCULATOR_MAX_EXPONENT", "100"))
+    # scrypt / pbkdf2 / bcrypt；COST 为空时用各算法的默认值
+    app.config["PASSWORD_HASH_METHOD"] = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    app.config["PASSWORD_HASH_COST"] = int(os.getenv("PASSWORD_HASH_COST", "0")) or None
+    app.config["PASSWORD_HASH_WORKERS"] = int(
+        os.getenv("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1)))
+    )
+    app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+    app.config["FRONTEND_DIR"] = str(FRONTEND_DIR)
+    app.config["STATIC_BUILD_DIR"] = os.getenv("STATIC_BUILD_DIR", str(BASE_DIR / "instance" / "static"))
+    app.config["STATIC_MEMORY_MAX_BYTES"] = int(os.getenv("STATIC_MEMORY_MAX_BYTES", str(256 * 1024)))
+    # /api/ 响应压缩：小于阈值的不压；br 仅在安装了 brotli 时可用
+    app.config["API_COMPRESSION"] = os.getenv("API_COMPRESSION", "1") == "1"
+    app.config["API_COMPRESSION_MIN_BYTES"] = int(os.getenv("API_COMPRESSION_MIN_BYTES", "1024"))
+    app.config["API_COMPRESSION_GZIP_LEVEL"] = int(os.getenv("API_COMPRESSION_GZIP_LEVEL", "6"))
+    app.config["API_COMPRESSION_BROTLI_QUALITY"] = int(os.getenv("API_COMPRESSION_BROTLI_QUALITY", "4"))
+    app.config["NOTES_IMPORT_BATCH_SIZE"] = int(os.getenv("NOTES_IMPORT_BATCH_SIZE", "1000"))
+    app.config["NOTES_IMPORT_MAX_BYTES"] = int(os.getenv("NOTES_IMPORT_MAX_BYTES", str(200 * 1024 * 1024)))
+    app.config["NOTES_IMPORT_ZIP_MAX_MEMBER_BYTES"] = int(
+        os.getenv("NOTES_IMPORT_ZIP_MAX_MEMBER_BYTES", str(10 * 1024 * 1024))
+    )
+    app.config["NOTES_IMPORT_ZIP_MAX_TOTAL_BYTES"] = int(
+        os.getenv("NOTES_IMPORT_ZIP_MAX_TOTAL_BYTES", str(1024 * 1024 * 1024))
+    )
+    app.config["NOTES_IMPORT_WORKERS"] = int(os.getenv("NOTES_IMPORT_WORKERS", "1"))
+    # memory：进程内 LRU；file：同机各 worker 共用的目录；none：关闭
+    app.config["CACHE_BACKEND"] = os.getenv("CACHE_BACKEND", "memory")
+    app.config["CACHE_DIR"] = os.getenv("CACHE_DIR", str(BASE_DIR / "instance" / "cache"))
+    app.config["CACHE_MAX_ENTRIES"] = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+    app.config["CACHE_DEFAULT_TTL"] = float(os.getenv("CACHE_DEFAULT_TTL", "60"))
+    app.config["CACHE_TAG_SYNC_INTERVAL"] = float(os.getenv("CACHE_TAG_SYNC_INTERVAL", "1"))
+    app.config["AVATAR_DIR"] = os.getenv("AVATAR_DIR", str(BASE_DIR / "instance" / "avatars"))
 
     app.config["REMEMBER_COOKIE_DURATION"] = 30
     app.config["REMEMBER_COOKIE_SECURE"] = False
     app.config["REMEMBER_COOKIE_HTTPONLY"] = True
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    init_engine_profiles(app, db)
+    init_replicas(app)
+    with app.app_context():
+        # 不依赖 init_db：跳过初始化启动的进程也要识别已建好的全文索引，写入时同步
+        resolve_search_backend(app)
+    configure_koculator_cache(app.config["KOCULATOR_CACHE_SIZE"])
+    configure_koculator_limits(
+        KoculatorLimits(
+            max_length=app.config["KOCULATOR_MAX_LENGTH"],
+            max_tokens=app.config["KOCULATOR_MAX_TOKENS"],
+            max_depth=app.config["KOCULATOR_MAX_DEPTH"],
+            max_operand_digits=app.config["KOCULATOR_MAX_OPERAND_DIGITS"],
+            precision=app.config["KOCULATOR_PRECISION"],
+            max_exponent=app.config["KOCULATOR_MAX_EXPONENT"],
+        )
+    )
+    password_hasher.configure(
+        app.config["PASSWORD_HASH_METHOD"],
+        app.config["PASSWORD_HASH_COST"],
+        app.config["PASSWORD_HASH_WORKERS"],
+        app.config["PASSWORD_HASH_MAX_PENDING"],
+    )
+    app.register_error_handler(PasswordHasherBusy, password_hasher_busy)
+    init_compression(app)
+    init_cache(app)
+
+    @app.cli.command("rebuild-stats")
+    def rebuild_stats_command():
+        """从业务表重建后台统计汇总（对账）。"""
+        counters = rebuild_stats()
+        db.session.commit()
+        print(counters)
+
+    @app.cli.command("sync-replicas")
+    def sync_replicas_command():
+        """本地开发：把主库 SQLite 文件复制到各个副本。"""
+        for path in copy_sqlite_replicas(app):
+            print(f"✓ {path}")
+
+    user_cache.configure(
+        app.config["USER_CACHE_SIZE"],
+        app.config["USER_CACHE_TTL"],
+        app.config["USER_CACHE_SYNC_INTERVAL"],
+    )
+    migrate.init_app(app, db, directory=str(BASE_DIR / "migrations"))
     cors.init_app(
         app,
         resources={r"/api/*": {"origins": ["http://localhost:5003", "http://127.0.0.1:5003"]}},
@@ -44,6 +188,7 @@ def create_app():
     login_manager.login_view = "auth.login"  # type: ignore[assignment]
 
     app.register_blueprint(auth_bp)
+    app.register_blueprint(health_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(announcements_bp)
     app.register_blueprint(password_resets_bp)
@@ -52,13 +197,14 @@ def create_app():
     app.register_blueprint(koculator_bp)
     app.register_blueprint(mymo_bp)
 
+    # 生产模式下 serve.py 会先 init_assets()，命中构建产物时走预压缩 + 长缓存
     @app.get("/")
     def index():
-        return send_from_directory(str(FRONTEND_DIR), "index.html")
+        return send_built_asset("index.html") or send_from_directory(str(FRONTEND_DIR), "index.html")
 
     @app.get("/<path:path>")
     def assets(path):
-        return send_from_directory(str(FRONTEND_DIR), path)
+        return send_built_asset(path) or send_from_directory(str(FRONTEND_DIR), path)
 
     return app
 
@@ -66,51 +212,40 @@ def create_app():
 app = create_app()
 
 
-def ensure_sqlite_schema():
-    uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
-    if not uri.startswith("sqlite:"):
-        return
+def backfill_note_digests(batch_size: int = 500):
+    # 老数据没有摘要/长度/哈希，分批补齐
+    from models import Note
+    from textutil import content_hash, make_excerpt
 
-    inspector = inspect(db.engine)
-    if "user" not in inspector.get_table_names():
-        return
-    columns = {column["name"] for column in inspector.get_columns("user")}
-    with db.session.begin():
-        if "role" not in columns:
+    while True:
+        rows = db.session.execute(
+            db.select(Note.id, Note.content).where(Note.content_hash == "").limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for nid, content in rows:
             db.session.execute(
-                text("ALTER TABLE user ADD COLUMN role VARCHAR(20) NOT NULL DEFAULT 'user'")
+                db.update(Note)
+                .where(Note.id == nid)
+                .values(
+                    excerpt=make_excerpt(content),
+                    content_length=len(content or ""),
+                    content_hash=content_hash(content),
+                    updated_at=Note.updated_at,
+                    version=Note.version + 1,
+                )
             )
-        if "active" not in columns:
-            db.session.execute(
-                text("ALTER TABLE user ADD COLUMN active BOOLEAN NOT NULL DEFAULT 1")
-            )
-        if "display_name" not in columns:
-            db.session.execute(
-                text("ALTER TABLE user ADD COLUMN display_name VARCHAR(80) NOT NULL DEFAULT ''")
-            )
-        if "phone" not in columns:
-            db.session.execute(
-                text("ALTER TABLE user ADD COLUMN phone VARCHAR(30) NOT NULL DEFAULT ''")
-            )
-        if "bio" not in columns:
-            db.session.execute(
-                text("ALTER TABLE user ADD COLUMN bio VARCHAR(280) NOT NULL DEFAULT ''")
-            )
-        if "avatar_url" not in columns:
-            db.session.execute(
-                text("ALTER TABLE user ADD COLUMN avatar_url TEXT NOT NULL DEFAULT ''")
-            )
-        db.session.execute(text("UPDATE user SET role = 'user' WHERE role IS NULL"))
-        db.session.execute(text("UPDATE user SET active = 1 WHERE active IS NULL"))
-        db.session.execute(text("UPDATE user SET display_name = '' WHERE display_name IS NULL"))
-        db.session.execute(text("UPDATE user SET phone = '' WHERE phone IS NULL"))
-        db.session.execute(text("UPDATE user SET bio = '' WHERE bio IS NULL"))
-        db.session.execute(text("UPDATE user SET avatar_url = '' WHERE avatar_url IS NULL"))
+        db.session.commit()
 
-if __name__ == "__main__":
+def init_db():
+    # 结构迁移到最新版本、数据迁移、建检索索引、创建管理员；只应在启动时跑一次
     with app.app_context():
-        db.create_all()
-        ensure_sqlite_schema()
+        upgrade_schema()
+        backfill_note_digests()
+        migrate_data_url_avatars()
+        ensure_search_index(app)
+        fail_interrupted_imports()
+        ensure_stats()
         admin_email = os.getenv("ADMIN_EMAIL")
         admin_password = os.getenv("ADMIN_PASSWORD")
         if admin_email and admin_password:
@@ -121,6 +256,8 @@ if __name__ == "__main__":
                 admin_user = User(email=admin_email, role="admin")  # type: ignore[call-arg]
                 admin_user.set_password(admin_password)
                 db.session.add(admin_user)
+                db.session.flush()
+                user_registered(admin_user)
                 db.session.commit()
                 print("✓ 管理员账号已创建")
             elif admin_user.role != "admin":
@@ -129,5 +266,9 @@ if __name__ == "__main__":
                 print("✓ 管理员账号已升级")
         print("✓ 数据库初始化完成")
 
-    print("✓ 启动 Frunk: http://localhost:5003")
-    app.run(debug=True, host="0.0.0.0", port=5003)
+
+if __name__ == "__main__":
+    # 兼容旧的启动方式；调试模式需显式加 --debug
+    from serve import main
+
+    raise SystemExit(main())
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from flask import current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:  # 没装 brotli 时只生成 gzip
+    brotli = None
+
+# 前端静态资源构建：按内容哈希改名，预压缩 gzip / br，并改写 index.html 里的引用
+ENTRY = "index.html"
+HASHED_SUFFIXES = {".css", ".js", ".svg"}
+MANIFEST = "manifest.json"
+REF_RE = re.compile(r'(?P<attr>src|href)="(?P<path>[^"]+)"')
+ONE_YEAR = 365 * 24 * 3600
+SUFFIXES = {"identity": "", "br": ".br", "gzip": ".gz"}
+
+
+def hashed_name(rel: str, digest: str) -> str:
+    stem, suffix = os.path.splitext(rel)
+    return f"{stem}.{digest[:12]}{suffix}"
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _write_variants(out_dir: Path, rel: str, data: bytes) -> list[str]:
+    # 只保留确实变小了的压缩版本
+    _write(out_dir / rel, data)
+    encodings = []
+    if brotli is not None:
+        packed = brotli.compress(data, quality=11)
+        if len(packed) < len(data):
+            _write(out_dir / f"{rel}{SUFFIXES['br']}", packed)
+            encodings.append("br")
+    packed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(packed) < len(data):
+        _write(out_dir / f"{rel}{SUFFIXES['gzip']}", packed)
+        encodings.append("gzip")
+    return encodings
+
+
+def build_assets(src_dir: Path, out_dir: Path) -> dict:
+    """把 src_dir 下的前端资源构建到 out_dir，返回并写出 manifest。
+
+    旧的哈希文件不删，正在使用旧页面的客户端仍能取到对应资源。
+    """
+    manifest: dict[str, dict] = {}
+    for path in sorted(src_dir.rglob("*")):
+        rel = path.relative_to(src_dir).as_posix()
+        if not path.is_file() or path.suffix not in HASHED_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        target = hashed_name(rel, digest)
+        encodings = _write_variants(out_dir, target, data)
+        manifest[rel] = {"path": target, "etag": digest[:32], "encodings": encodings, "hashed": True}
+
+    html = (src_dir / ENTRY).read_text(encoding="utf-8")
+    html = REF_RE.sub(
+        lambda m: f'{m["attr"]}="{manifest[m["path"]]["path"]}"' if m["path"] in manifest else m[0],
+        html,
+    )
+    data = html.encode("utf-8")
+    encodings = _write_variants(out_dir, ENTRY, data)
+    manifest[ENTRY] = {
+        "path": ENTRY,
+        "etag": hashlib.sha256(data).hexdigest()[:32],
+        "encodings": encodings,
+        "hashed": False,
+    }
+    _write(out_dir / MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+@dataclass(frozen=True)
+class Asset:
+    path: str
+    etag: str
+    mimetype: str
+    immutable: bool
+    encodings: tuple[str, ...]
+    # 小文件按编码常驻内存：{"identity": ..., "br": ..., "gzip": ...}
+    bodies: dict[str, bytes] = field(default_factory=dict)
+
+
+class AssetStore:
+    def __init__(self, root: Path, manifest: dict, memory_limit: int):
+        self.root = root
+        self.assets: dict[str, Asset] = {}
+        for logical, entry in manifest.items():
+            mimetype = mimetypes.guess_type(logical)[0] or "application/octet-stream"
+            bodies = {}
+            if (root / entry["path"]).stat().st_size <= memory_limit:
+                bodies = {
+                    enc: (root / f"{entry['path']}{SUFFIXES[enc]}").read_bytes()
+                    for enc in ("identity", *entry["encodings"])
+                }
+            encodings = tuple(entry["encodings"])
+            hashed = Asset(entry["path"], entry["etag"], mimetype, entry["hashed"], encodings, bodies)
+            self.assets[entry["path"]] = hashed
+            # 未带哈希的旧路径也能访问，但不做长缓存
+            if logical != entry["path"]:
+                self.assets[logical] = Asset(hashed.path, hashed.etag, mimetype, False, encodings, bodies)
+
+    @classmethod
+    def load(cls, root: Path, memory_limit: int) -> AssetStore:
+        manifest = json.loads((root / MANIFEST).read_text())
+        return cls(root, manifest, memory_limit)
+
+    def get(self, path: str) -> Asset | None:
+        return self.assets.get(path)
+
+
+def init_assets(app) -> AssetStore:
+    # 启动时构建一次（生产模式下在 fork 之前），之后各 worker 共用内存里的副本
+    root = Path(app.config["STATIC_BUILD_DIR"])
+    build_assets(Path(app.config["FRONTEND_DIR"]), root)
+    store = AssetStore.load(root, app.config["STATIC_MEMORY_MAX_BYTES"])
+    app.extensions["asset_store"] = store
+    return store
+
+
+def pick_encoding(asset: Asset) -> str:
+    accepted = request.accept_encodings
+    for encoding in asset.encodings:
+        if accepted[encoding] > 0:
+            return encoding
+    return "identity"
+
+
+def send_built_asset(path: str):
+    """命中构建产物时返回响应，否则返回 None 由调用方回退到源文件。"""
+    store: AssetStore | None = current_app.extensions.get("asset_store")
+    asset = store.get(path) if store else None
+    if asset is None:
+        return None
+
+    encoding = pick_encoding(asset)
+    if encoding in asset.bodies:
+        response = current_app.response_class(asset.bodies[encoding], mimetype=asset.mimetype)
+    else:
+        path = store.root / f"{asset.path}{SUFFIXES[encoding]}"
+        response = send_file(path, mimetype=asset.mimetype, conditional=False, etag=False)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(asset.etag if encoding == "identity" else f"{asset.etag}-{encoding}")
+    if asset.immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = ONE_YEAR
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+
+from flask import current_app
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from extensions import db
+from models import User
+
+# 头像按内容哈希存盘，用户表里只留一个短 URL
+THUMB_SIZES = (64, 128, 256)
+DEFAULT_SIZE = 128
+MAX_AVATAR_BYTES = 2 * 1024 * 1024
+MAX_AVATAR_PIXELS = 4096 * 4096
+ALLOWED_FORMATS = {"PNG", "JPEG", "GIF", "WEBP"}
+
+DATA_URL_RE = re.compile(r"^data:image/[\w.+-]+;base64,(?P<data>.+)$", re.DOTALL)
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class AvatarError(Exception):
+    pass
+
+
+def avatar_dir() -> Path:
+    return Path(current_app.config["AVATAR_DIR"])
+
+
+def avatar_path(digest: str, size: int) -> Path:
+    return avatar_dir() / digest[:2] / f"{digest}_{size}.png"
+
+
+def avatar_url(digest: str) -> str:
+    return f"/api/profile/avatars/{digest}"
+
+
+def decode_data_url(value: str) -> bytes:
+    m = DATA_URL_RE.match(value.strip())
+    if not m:
+        raise AvatarError("Invalid image data")
+    try:
+        return base64.b64decode(m.group("data"), validate=False)
+    except (binascii.Error, ValueError) as exc:
+        raise AvatarError("Invalid image data") from exc
+
+
+def store_avatar(raw: bytes) -> str:
+    """解码图片，按尺寸生成 PNG 缩略图并写盘，返回内容哈希。相同图片只存一份。"""
+    if len(raw) > MAX_AVATAR_BYTES:
+        raise AvatarError("Avatar too large")
+    try:
+        image = Image.open(io.BytesIO(raw))
+        if image.width * image.height > MAX_AVATAR_PIXELS:
+            raise AvatarError("Avatar too large")
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise AvatarError("Invalid image data") from exc
+    if image.format not in ALLOWED_FORMATS:
+        raise AvatarError("Unsupported image format")
+
+    digest = hashlib.sha256(raw).hexdigest()
+    if all(avatar_path(digest, size).exists() for size in THUMB_SIZES):
+        return digest
+
+    image = ImageOps.exif_transpose(image).convert("RGBA")
+    for size in THUMB_SIZES:
+        target = avatar_path(digest, size)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        tmp = target.with_suffix(f".{os.getpid()}.tmp")
+        thumb.save(tmp, format="PNG", optimize=True)
+        os.replace(tmp, target)
+    return digest
+
+
+def thumbnail_for(digest: str, size: int | None) -> Path | None:
+    if not DIGEST_RE.match(digest):
+        return None
+    # 请求尺寸向上取最接近的一档
+    wanted = size or DEFAULT_SIZE
+    chosen = next((s for s in THUMB_SIZES if s >= wanted), THUMB_SIZES[-1])
+    path = avatar_path(digest, chosen)
+    return path if path.exists() else None
+
+
+def migrate_data_url_avatars() -> int:
+    # 旧数据：avatar_url 里直接存的 data URL，搬进头像目录后换成短 URL
+    migrated = 0
+    user_ids = db.session.scalars(db.select(User.id).where(User.avatar_url.like("data:%"))).all()
+    for uid in user_ids:
+        value = db.session.scalar(db.select(User.avatar_url).where(User.id == uid))
+        try:
+            digest = store_avatar(decode_data_url(value))
+        except AvatarError:
+            current_app.logger.warning("Dropping unreadable avatar for user %s", uid)
+            new_url = ""
+        else:
+            new_url = avatar_url(digest)
+            migrated += 1
+        db.session.execute(db.update(User).where(User.id == uid).values(avatar_url=new_url))
+        db.session.commit()
+    return migrated
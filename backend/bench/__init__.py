@@ -0,0 +1 @@
+"""基准测试与模糊测试脚本（在 backend/ 下运行：python -m bench.<名称>）。"""
@@ -0,0 +1,154 @@
+"""数据库写并发基准：模拟多个 worker 进程 × 线程同时自动保存笔记，对比引擎配置档开/关的写吞吐。
+
+    python -m bench.db_write_bench                         # 临时 SQLite 库，profile none 与 auto 各跑一遍
+    python -m bench.db_write_bench --workers 4 --threads 4 --duration 5
+    python -m bench.db_write_bench --profiles auto --database-uri mysql+pymysql://...  # 指向一个空库
+
+每种配置档用一个全新的库（WAL 会写进库文件，不能复用）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_ENV = {
+    # 基准测的是数据库写入，登录时的密码哈希用最低成本、在当前进程里算
+    "PASSWORD_HASH_METHOD": "pbkdf2",
+    "PASSWORD_HASH_COST": "1000",
+    "PASSWORD_HASH_WORKERS": "0",
+    "API_COMPRESSION": "0",
+}
+PASSWORD = "bench-password"
+
+
+def _setup_env(uri: str, profile: str) -> None:
+    # app 在导入时读取配置，子进程里先设好环境变量再导入
+    os.environ.update(BENCH_ENV)
+    os.environ["SQLALCHEMY_DATABASE_URI"] = uri
+    os.environ["DB_ENGINE_PROFILE"] = profile
+
+
+def prepare(uri: str, profile: str, users: int) -> None:
+    _setup_env(uri, profile)
+    from app import app, init_db
+
+    init_db()
+    client = app.test_client()
+    for i in range(users):
+        response = client.post("/api/auth/register", json={"email": f"bench{i}@example.com", "password": PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f"register failed: {response.status_code} {response.get_data(as_text=True)}")
+
+
+def worker(uri: str, profile: str, index: int, threads: int, barrier, duration: float, queue) -> None:
+    _setup_env(uri, profile)
+    import logging
+
+    from app import app
+
+    # 失败的请求按 500 计数，不打印堆栈
+    app.logger.setLevel(logging.CRITICAL)
+
+    def run(slot: int, result: dict) -> None:
+        client = app.test_client()
+        email = f"bench{(index * threads + slot)}@example.com"
+        client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+        nid = client.post("/api/notes/", json={"title": "autosave", "content": ""}).get_json()["id"]
+        # 所有进程的所有线程都登录完再一起开始写
+        barrier.wait()
+        deadline = time.monotonic() + duration
+        latencies, errors, n = [], 0, 0
+        while time.monotonic() < deadline:
+            n += 1
+            began = time.perf_counter()
+            response = client.put(f"/api/notes/{nid}", json={"content": f"draft {n} " + "x" * 200})
+            latencies.append(time.perf_counter() - began)
+            if response.status_code != 200:
+                errors += 1
+        result.update(latencies=latencies, errors=errors)
+
+    results = [{} for _ in range(threads)]
+    pool = [threading.Thread(target=run, args=(slot, results[slot])) for slot in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put(
+        {
+            "latencies": [x for r in results for x in r.get("latencies", [])],
+            "errors": sum(r.get("errors", 0) for r in results),
+        }
+    )
+
+
+def run_profile(profile: str, uri: str, workers: int, threads: int, duration: float) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    setup = ctx.Process(target=prepare, args=(uri, profile, workers * threads))
+    setup.start()
+    setup.join()
+    if setup.exitcode:
+        raise RuntimeError("setup failed")
+
+    queue = ctx.Queue()
+    barrier = ctx.Barrier(workers * threads)
+    procs = [
+        ctx.Process(target=worker, args=(uri, profile, i, threads, barrier, duration, queue))
+        for i in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    parts = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    latencies = sorted(x for part in parts for x in part["latencies"])
+    errors = sum(part["errors"] for part in parts)
+    total = len(latencies)
+
+    def pct(p: float) -> float:
+        return latencies[min(total - 1, int(total * p))] * 1000 if total else 0.0
+
+    return {
+        "profile": profile,
+        "writes": total - errors,
+        "errors": errors,
+        "writes_per_sec": round((total - errors) / duration, 1),
+        "p50_ms": round(pct(0.5), 2),
+        "p99_ms": round(pct(0.99), 2),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=["none", "auto"])
+    parser.add_argument("--database-uri", help="empty database (only with a single profile)")
+    parser.add_argument("--workers", type=int, default=4, help="processes, like gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="threads per process")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of writes per profile")
+    args = parser.parse_args(argv)
+    if args.database_uri and len(args.profiles) > 1:
+        parser.error("--database-uri needs a fresh database per profile, pass a single --profiles")
+
+    rows = []
+    for profile in args.profiles:
+        uri = args.database_uri or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        rows.append(run_profile(profile, uri, args.workers, args.threads, args.duration))
+
+    print(f"\n{args.workers} processes x {args.threads} threads, {args.duration:.0f}s each")
+    print(f"{'profile':<10}{'writes/s':>10}{'ok':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in rows:
+        print(
+            f"{row['profile']:<10}{row['writes_per_sec']:>10.1f}{row['writes']:>8}"
+            f"{row['errors']:>8}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Koculator 引擎基准：分阶段统计 ops/sec 与单次调用的内存峰值、分配块数，并与基线对比。
+
+    python -m bench.koculator_bench            # 跑一遍并和基线对比，退化则退出码 1
+    python -m bench.koculator_bench --update   # 用本机结果覆盖基线
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from tools.koculator import UNLIMITED, configure_limits, evaluate_postfix, format_result, to_postfix, tokenize
+
+BASELINE_PATH = Path(__file__).with_name("koculator_baseline.json")
+STAGES = ("tokenize", "to_postfix", "evaluate_postfix", "format_result")
+
+
+def build_cases() -> dict[str, str]:
+    return {
+        "short": "1+2*3-(4/5)",
+        "long_flat": "+".join(f"{i}.5*{i % 7 + 1}" for i in range(1, 1001)),
+        "deep_nested": "(" * 500 + "1+2" + ")" * 500,
+        "large_operands": "*".join(["9" * 400] * 3) + "/" + "7" * 300,
+    }
+
+
+def stage_inputs(expr: str) -> dict:
+    tokens = tokenize(expr)
+    postfix = to_postfix(tokens)
+    value = evaluate_postfix(postfix)
+    return {
+        "tokenize": (tokenize, expr),
+        "to_postfix": (to_postfix, tokens),
+        "evaluate_postfix": (evaluate_postfix, postfix),
+        "format_result": (format_result, value),
+    }
+
+
+def measure(func, arg, min_time: float) -> dict:
+    # 先估计单次耗时，再跑够 min_time，取 5 轮里最快的一轮
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(arg)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 5 or loops >= 1 << 20:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(4):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(arg)
+        best = min(best, time.perf_counter() - start)
+
+    # 调用前后各拍一次快照，按分配位置累加块数，差值即这一次调用（连同返回值）留下的分配数
+    tracemalloc.start()
+    before = allocation_count(tracemalloc.take_snapshot())
+    tracemalloc.reset_peak()
+    result = func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    after = allocation_count(tracemalloc.take_snapshot())
+    tracemalloc.stop()
+    del result
+    return {"ops_per_sec": round(loops / best, 1), "peak_bytes": peak, "allocations": after - before}
+
+
+def allocation_count(snapshot: tracemalloc.Snapshot) -> int:
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    return sum(stat.count for stat in snapshot.statistics("lineno"))
+
+
+def run(min_time: float) -> dict:
+    results: dict[str, dict] = {}
+    for case, expr in build_cases().items():
+        inputs = stage_inputs(expr)
+        results[case] = {stage: measure(*inputs[stage], min_time) for stage in STAGES}
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    failures = []
+    for case, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(case, {}).get(stage)
+            if not base:
+                continue
+            floor = base["ops_per_sec"] * (1 - tolerance)
+            if current["ops_per_sec"] < floor:
+                failures.append(
+                    f"{case}/{stage}: {current['ops_per_sec']:.0f} ops/s "
+                    f"< {floor:.0f} (baseline {base['ops_per_sec']:.0f}, tolerance {tolerance:.0%})"
+                )
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="rewrite the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown (0.5 = 50%%)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per measurement")
+    args = parser.parse_args(argv)
+    # 基准测的是引擎本身的吞吐，不受线上成本上限影响
+    configure_limits(UNLIMITED)
+
+    results = run(args.min_time)
+    print(f"{'case':<16}{'stage':<18}{'ops/sec':>14}{'peak bytes':>14}{'allocations':>14}")
+    for case, stages in results.items():
+        for stage, r in stages.items():
+            print(f"{case:<16}{stage:<18}{r['ops_per_sec']:>14.1f}{r['peak_bytes']:>14}{r['allocations']:>14}")
+
+    if args.update:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {BASELINE_PATH}")
+        return 0
+
+    if not BASELINE_PATH.exists():
+        print("no baseline yet, run with --update first")
+        return 0
+    failures = compare(results, json.loads(BASELINE_PATH.read_text()), args.tolerance)
+    if failures:
+        print("\nPERFORMANCE REGRESSION:")
+        for line in failures:
+            print("  " + line)
+        return 1
+    print("\nno regression against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
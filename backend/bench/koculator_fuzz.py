@@ -0,0 +1,196 @@
+"""Koculator 解析器的性质测试（fuzz）：
+
+1. 随机生成表达式树，用 Fraction 独立求值作为参照，检查解析+求值结果一致；
+2. 对随机字符串与变异表达式，只允许抛 CalcError，不允许其他异常；
+3. 对几类输入族按规模翻倍计时，发现超线性增长就报警。
+
+    python -m bench.koculator_fuzz --iterations 5000 --seed 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from decimal import Decimal
+from fractions import Fraction
+
+from tools.koculator import (
+    UNLIMITED,
+    CalcError,
+    configure_limits,
+    evaluate_postfix,
+    format_result,
+    to_postfix,
+    tokenize,
+)
+
+OPS = "+-*/"
+
+
+class DivByZero(Exception):
+    pass
+
+
+def gen_tree(rng: random.Random, depth: int):
+    if depth <= 0 or rng.random() < 0.3:
+        whole = str(rng.randint(0, 10 ** rng.choice((1, 3, 6, 40))))
+        if rng.random() < 0.4:
+            return ("num", whole + "." + str(rng.randint(0, 999)).zfill(rng.randint(1, 3)))
+        return ("num", whole)
+    kind = rng.random()
+    if kind < 0.15:
+        return ("neg", gen_tree(rng, depth - 1))
+    if kind < 0.25:
+        return ("paren", gen_tree(rng, depth - 1))
+    return ("bin", rng.choice(OPS), gen_tree(rng, depth - 1), gen_tree(rng, depth - 1))
+
+
+def render(node) -> str:
+    # 二元运算两侧都加括号，保证渲染出的文本与树结构一一对应
+    kind = node[0]
+    if kind == "num":
+        return node[1]
+    if kind == "neg":
+        return "-(" + render(node[1]) + ")"
+    if kind == "paren":
+        return "(" + render(node[1]) + ")"
+    _, op, left, right = node
+    return "(" + render(left) + ")" + op + "(" + render(right) + ")"
+
+
+def reference(node) -> Fraction:
+    kind = node[0]
+    if kind == "num":
+        return Fraction(node[1])
+    if kind in {"neg", "paren"}:
+        value = reference(node[1])
+        return -value if kind == "neg" else value
+    _, op, left, right = node
+    a, b = reference(left), reference(right)
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if b == 0:
+        raise DivByZero
+    return a / b
+
+
+def evaluate(expr: str) -> Decimal:
+    return evaluate_postfix(to_postfix(tokenize(expr)))
+
+
+def check_correctness(rng: random.Random, iterations: int) -> list[str]:
+    failures = []
+    for _ in range(iterations):
+        tree = gen_tree(rng, rng.randint(1, 6))
+        expr = render(tree)
+        try:
+            expected = reference(tree)
+        except DivByZero:
+            try:
+                evaluate(expr)
+                failures.append(f"expected divide-by-zero: {expr}")
+            except CalcError as exc:
+                if exc.code != "div_by_zero":
+                    failures.append(f"wrong error {exc!r}: {expr}")
+            continue
+        try:
+            got = Fraction(evaluate(expr))
+        except CalcError as exc:
+            failures.append(f"unexpected {exc!r}: {expr}")
+            continue
+        # Decimal 默认 28 位有效数字，允许相对误差
+        tolerance = Fraction(1, 10**20) * max(1, abs(expected))
+        if abs(got - expected) > tolerance:
+            failures.append(f"{expr} = {float(got)}, expected {float(expected)}")
+    return failures
+
+
+def check_robustness(rng: random.Random, iterations: int) -> list[str]:
+    alphabet = "0123456789999999.+-*/() x\t"
+    failures = []
+    for i in range(iterations):
+        if i % 2:
+            expr = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        else:
+            chars = list(render(gen_tree(rng, 4)))
+            for _ in range(rng.randint(1, 3)):
+                chars.insert(rng.randrange(len(chars) + 1), rng.choice(alphabet))
+            expr = "".join(chars)
+        try:
+            format_result(evaluate(expr))
+        except CalcError:
+            pass
+        except Exception as exc:  # noqa: BLE001 — 任何非 CalcError 都是缺陷
+            failures.append(f"{type(exc).__name__}: {exc} for {expr!r}")
+    return failures
+
+
+FAMILIES = {
+    "flat": lambda n: "+".join(["1"] * n),
+    "nested": lambda n: "(" * n + "1" + ")" * n,
+    "unary": lambda n: "-" * n + "1",
+    "long_literal": lambda n: "1" * n + "+1",
+}
+
+
+def timed(expr: str) -> float:
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        try:
+            evaluate(expr)
+        except CalcError:
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_scaling(base_size: int, max_ratio: float) -> list[str]:
+    # 规模扩大 4 倍，线性算法耗时约 4 倍；超过 max_ratio 视为超线性
+    failures = []
+    for name, build in FAMILIES.items():
+        small = timed(build(base_size))
+        large = timed(build(base_size * 4))
+        ratio = large / small if small else 0.0
+        print(f"  {name:<14} n={base_size:<6} x4 time ratio {ratio:5.1f}")
+        if ratio > max_ratio:
+            failures.append(f"{name}: time grew {ratio:.1f}x for 4x input (limit {max_ratio}x)")
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Koculator fuzz harness")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--scale-size", type=int, default=5000)
+    parser.add_argument("--max-ratio", type=float, default=8.0)
+    args = parser.parse_args(argv)
+    # 扩展性检查需要远超线上上限的输入规模
+    configure_limits(UNLIMITED)
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    rng = random.Random(seed)
+    print(f"seed {seed}")
+
+    failures = check_correctness(rng, args.iterations)
+    failures += check_robustness(rng, args.iterations)
+    print("scaling:")
+    failures += check_scaling(args.scale_size, args.max_ratio)
+
+    if failures:
+        print(f"\n{len(failures)} failure(s):")
+        for line in failures[:50]:
+            print("  " + line)
+        return 1
+    print("\nall properties hold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""热点接口的查询计划检查：造一份数据，逐个请求热点接口，对发出的每条 SELECT 跑 EXPLAIN。
+
+    python -m bench.query_plans                                 # 临时 SQLite 库
+    python -m bench.query_plans --database-uri mysql+pymysql://...  # 指向一个空库
+
+热点表（note / note_tags / tag / password_reset_request）上出现全表扫描则退出码 1。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+HOT_TABLES = {"note", "note_tags", "tag", "password_reset_request"}
+PROBE_EMAIL = "probe@example.com"
+PROBE_PASSWORD = "probe-password"
+SQLITE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?! USING)")
+
+
+def seed(users: int, notes_per_user: int, tags_per_user: int, resets: int) -> None:
+    from sqlalchemy import insert, text
+
+    from extensions import db
+    from models import Note, PasswordResetRequest, Tag, User, note_tags
+    from passwords import password_hasher
+    from stats import rebuild_stats
+    from textutil import content_hash, make_excerpt
+
+    now = datetime.now()
+    password_hash = password_hasher.hash(PROBE_PASSWORD)
+    db.session.execute(
+        insert(User),
+        [
+            {
+                "email": PROBE_EMAIL if i == 0 else f"user{i}@example.com",
+                "password_hash": password_hash,
+                "role": "admin" if i == 0 else "user",
+                "active": True,
+                "created_at": now - timedelta(minutes=i),
+            }
+            for i in range(users)
+        ],
+    )
+    user_ids = list(db.session.scalars(db.select(User.id).order_by(User.id)))
+    db.session.execute(
+        insert(Tag),
+        [
+            {"name": f"tag{t}", "color": "#007bff", "user_id": uid, "created_at": now}
+            for uid in user_ids
+            for t in range(tags_per_user)
+        ],
+    )
+    tags_by_user: dict[int, list[int]] = {}
+    for tid, uid in db.session.execute(db.select(Tag.id, Tag.user_id)):
+        tags_by_user.setdefault(uid, []).append(tid)
+
+    for uid in user_ids:
+        rows = []
+        for n in range(notes_per_user):
+            content = f"note {n} of user {uid}"
+            stamp = now - timedelta(minutes=n)
+            rows.append(
+                {
+                    "user_id": uid,
+                    "title": f"note {n}",
+                    "content": content,
+                    "excerpt": make_excerpt(content),
+                    "content_length": len(content),
+                    "content_hash": content_hash(content),
+                    "is_pinned": n % 20 == 0,
+                    "version": 1,
+                    "created_at": stamp,
+                    "updated_at": stamp,
+                }
+            )
+        db.session.execute(insert(Note), rows)
+    links = []
+    for nid, uid in db.session.execute(db.select(Note.id, Note.user_id)):
+        tag_ids = tags_by_user[uid]
+        links.append({"note_id": nid, "tag_id": tag_ids[nid % len(tag_ids)]})
+    db.session.execute(insert(note_tags), links)
+    db.session.execute(
+        insert(PasswordResetRequest),
+        [
+            {
+                "email": f"user{i % users}@example.com",
+                "status": "pending" if i % 10 == 0 else "done",
+                "created_at": now - timedelta(minutes=i),
+            }
+            for i in range(resets)
+        ],
+    )
+    rebuild_stats()
+    db.session.commit()
+    # 让规划器拿到真实的数据分布，结果才和线上一致
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(text("ANALYZE"))
+    elif db.engine.dialect.name == "mysql":
+        db.session.execute(text(f"ANALYZE TABLE {', '.join(sorted(HOT_TABLES))}"))
+    db.session.commit()
+
+
+def explain(connection, statement: str, parameters) -> tuple[list[str], list[str]]:
+    """返回 (计划描述, 热点表上的全表扫描)。"""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        plan = [row[-1] for row in rows]
+        scans = [m[1] for m in map(SQLITE_SCAN_RE.match, plan) if m and m[1] in HOT_TABLES]
+        return plan, scans
+    rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+    plan = [f"{row['table']}: type={row['type']} key={row['key']}" for row in rows]
+    scans = [row["table"] for row in rows if row["type"] == "ALL" and row["table"] in HOT_TABLES]
+    return plan, scans
+
+
+def capture(app, client, url: str) -> list[tuple[str, object]]:
+    from sqlalchemy import event
+
+    from extensions import db
+
+    statements: list[tuple[str, object]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return statements
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-uri", help="empty database to seed (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--notes-per-user", type=int, default=50)
+    parser.add_argument("--tags-per-user", type=int, default=10)
+    parser.add_argument("--resets", type=int, default=2000)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every statement and plan")
+    args = parser.parse_args(argv)
+
+    uri = args.database_uri or f"sqlite:///{tempfile.mkdtemp()}/plans.db"
+    # app 在导入时读取配置，必须先设好库地址
+    os.environ["SQLALCHEMY_DATABASE_URI"] = uri
+    from app import app, init_db
+    from extensions import db
+    from models import Tag, User
+
+    init_db()
+    with app.app_context():
+        if db.session.scalar(db.select(db.func.count(User.id))):
+            print(f"{uri} is not empty, refusing to seed")
+            return 2
+        seed(args.users, args.notes_per_user, args.tags_per_user, args.resets)
+        probe_tag = db.session.scalar(
+            db.select(Tag.id).join(User, User.id == Tag.user_id).where(User.email == PROBE_EMAIL).limit(1)
+        )
+
+    client = app.test_client()
+    response = client.post("/api/auth/login", json={"email": PROBE_EMAIL, "password": PROBE_PASSWORD})
+    if response.status_code != 200:
+        print(f"login failed: {response.status_code}")
+        return 2
+    next_cursor = client.get("/api/notes/?cursor=&per_page=20").get_json()["next_cursor"]
+
+    endpoints = {
+        "notes (page)": "/api/notes/?page=2&per_page=20&view=summary",
+        "notes (cursor)": f"/api/notes/?cursor={next_cursor}&per_page=20&view=summary",
+        "notes by tag": f"/api/notes/?tag_id={probe_tag}&cursor=&per_page=20",
+        "tags": "/api/notes/tags",
+        "admin users + stats": "/api/admin/users?with_stats=1",
+        "admin resets (pending)": "/api/admin/password-resets?status=pending",
+    }
+    failures = []
+    with app.app_context(), db.engine.connect() as connection:
+        for name, url in endpoints.items():
+            statements = capture(app, client, url)
+            scanned = set()
+            for statement, parameters in statements:
+                plan, scans = explain(connection, statement, parameters)
+                scanned.update(scans)
+                if args.verbose or scans:
+                    print(f"  {' '.join(statement.split())[:160]}")
+                    for line in plan:
+                        print(f"    {line}")
+            status = f"FULL SCAN of {', '.join(sorted(scanned))}" if scanned else "ok"
+            print(f"{name:<26}{len(statements):>3} queries  {status}")
+            if scanned:
+                failures.append(name)
+
+    if failures:
+        print(f"\n{len(failures)} endpoint(s) scan a hot table: {', '.join(failures)}")
+        return 1
+    print("\nall hot endpoints use indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import pickle
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db_routing import primary_reads
+from user_cache import TTLCache, user_cache
+
+# 通用缓存层：值放在后端（进程内 LRU，或同机多个 worker 共用的文件目录），
+# 失效按标签做：每个标签有一个版本号，存在 cache_version 表里，写路径在业务事务里自增；
+# 缓存键带上相关标签的版本号，版本一变旧条目自然失配，等 LRU / TTL 淘汰。
+BACKENDS = {"memory", "file", "none"}
+VERSION_PREFIX = "cache:"
+LOCK_STRIPES = 64
+
+
+def user_tag(user_id: int) -> str:
+    # 用户资料（profile、登录快照之外的字段）
+    return f"user:{user_id}"
+
+
+def note_tags_tag(user_id: int) -> str:
+    # 用户的标签列表及每个标签的笔记数
+    return f"note-tags:{user_id}"
+
+
+ANNOUNCEMENTS_TAG = "announcements"
+
+
+class FileBackend:
+    """同机共享的缓存后端：每个键一个文件，多个 worker 进程都能读到。
+
+    目录只应对本服务可写（值用 pickle 序列化）。条目数超过 maxsize 时按修改时间淘汰最旧的。
+    """
+
+    def __init__(self, directory: str | Path, maxsize: int = 10000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / "locks").mkdir(exist_ok=True)
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / hashlib.sha256(key.encode()).hexdigest()[:40]
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            expires_at, stored_key, value = pickle.loads(path.read_bytes())
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            expires_at, stored_key, value = 0.0, None, None
+        if stored_key != key or expires_at <= time.time():
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value, ttl: float | None = None) -> None:
+        if not ttl or ttl <= 0:
+            return
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(pickle.dumps((time.time() + ttl, key, value), protocol=pickle.HIGHEST_PROTOCOL))
+        os.replace(tmp, path)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 256 == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> None:
+        entries = []
+        for path in self.directory.iterdir():
+            if path.is_file() and not path.name.endswith(".tmp"):
+                with contextlib.suppress(OSError):
+                    entries.append((path.stat().st_mtime, path))
+        excess = len(entries) - self.maxsize
+        if excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            with contextlib.suppress(OSError):
+                path.unlink()
+        with self._lock:
+            self.evictions += excess
+
+    @contextlib.contextmanager
+    def lock(self, key: str):
+        # 跨进程互斥：键按哈希落到固定数量的锁文件上，锁文件不用清理
+        stripe = int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) % LOCK_STRIPES
+        with open(self.directory / "locks" / f"{stripe}.lock", "a+b") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        for path in self.directory.iterdir():
+            if path.is_file():
+                with contextlib.suppress(OSError):
+                    path.unlink()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": sum(1 for p in self.directory.iterdir() if p.is_file()),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class Cache:
+    def __init__(self):
+        self.backend: TTLCache | FileBackend | None = None
+        self.backend_name = "none"
+        self.default_ttl = 60.0
+        self.tag_sync_interval = 1.0
+        self._tag_versions: dict[str, tuple[float, int]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, list] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def configure(self, backend: str, default_ttl: float, maxsize: int, directory: str, tag_sync_interval: float):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+        if backend == "memory":
+            self.backend = TTLCache(maxsize=maxsize, ttl=default_ttl)
+        elif backend == "file":
+            self.backend = FileBackend(directory, maxsize)
+        else:
+            self.backend = None
+        self.backend_name = backend
+        self.default_ttl = default_ttl
+        self.tag_sync_interval = tag_sync_interval
+        self._tag_versions.clear()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def tag_versions(self, tags) -> tuple[int, ...]:
+        """各标签的当前版本号；本进程内缓存 tag_sync_interval 秒，过期的一次查询补齐。"""
+        if not tags:
+            return ()
+        now = time.monotonic()
+        with self._lock:
+            known = {tag: entry[1] for tag in tags if (entry := self._tag_versions.get(tag)) and entry[0] > now}
+        missing = [tag for tag in tags if tag not in known]
+        if missing:
+            from extensions import db
+            from models import CacheVersion
+
+            stmt = (
+                db.select(CacheVersion.key, CacheVersion.version)
+                .where(CacheVersion.key.in_([VERSION_PREFIX + tag for tag in missing]))
+                .execution_options(use_primary=True)
+            )
+            fetched = {key[len(VERSION_PREFIX):]: version for key, version in db.session.execute(stmt)}
+            expires = now + self.tag_sync_interval
+            with self._lock:
+                for tag in missing:
+                    known[tag] = fetched.get(tag, 0)
+                    self._tag_versions[tag] = (expires, known[tag])
+        return tuple(known[tag] for tag in tags)
+
+    @contextlib.contextmanager
+    def _single_flight(self, key: str):
+        # 同一个键同一时间只让一个线程（文件后端下是一个进程）去重建
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                cross_process = getattr(self.backend, "lock", None)
+                with cross_process(key) if cross_process else contextlib.nullcontext():
+                    yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._key_locks.pop(key, None)
+
+    def get_or_set(self, key: str, build, tags=(), ttl: float | None = None):
+        """取缓存，未命中时调用 build() 生成并写入。build 返回 None 的结果不缓存。"""
+        if self.backend is None:
+            return build()
+        tags = list(tags)
+        full_key = f"{key}|{','.join(tags)}|{self.tag_versions(tags)}"
+        value = self.backend.get(full_key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._single_flight(full_key):
+            value = self.backend.get(full_key)
+            if value is not None:
+                # 等锁期间别的线程/进程已经建好了
+                with self._lock:
+                    self.coalesced += 1
+                return value
+            with self._lock:
+                self.misses += 1
+            # 版本号是从主库读的，重建也必须读主库：否则副本上的旧数据会挂在新版本号下，
+            # 直到 TTL 过期都不会再失效
+            with primary_reads():
+                value = build()
+            if value is not None:
+                self.backend.put(full_key, value, self.default_ttl if ttl is None else ttl)
+        return value
+
+    def invalidate(self, *tags: str) -> None:
+        """在写事务里调用：标签版本号随业务数据一起提交，提交后各 worker 最迟 tag_sync_interval 秒内失效。"""
+        if self.backend is None or not tags:
+            return
+        from extensions import db
+        from models import CacheVersion
+
+        for tag in tags:
+            CacheVersion.bump(VERSION_PREFIX + tag)
+        db.session.info.setdefault("cache_tags", set()).update(tags)
+
+    def forget_versions(self, tags) -> None:
+        with self._lock:
+            for tag in tags:
+                self._tag_versions.pop(tag, None)
+            self.invalidations += len(tags)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            payload = {
+                "backend": self.backend_name,
+                "default_ttl": self.default_ttl,
+                "tag_sync_interval": self.tag_sync_interval,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+        if self.backend is not None:
+            backend = self.backend.stats()
+            payload["size"] = backend["size"]
+            payload["maxsize"] = backend["maxsize"]
+            payload["evictions"] = backend["evictions"]
+        payload["users"] = user_cache.stats()
+        return payload
+
+
+cache = Cache()
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_tags(session) -> None:
+    # 本进程立即重新读取刚提交的标签版本，不必等 tag_sync_interval
+    tags = session.info.pop("cache_tags", None)
+    if tags:
+        cache.forget_versions(tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_tags(session) -> None:
+    session.info.pop("cache_tags", None)
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cached_view(name: str, tags=None, per_user: bool = True, ttl: float | None = None):
+    """缓存视图的 200 响应体。per_user 时按当前用户区分；tags 可以是列表或返回列表的函数。
+
+    放在 @login_required 之后（内层）。
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not cache.enabled:
+                return view(*args, **kwargs)
+            owner = current_user.id if per_user else "*"
+            key = f"view:{name}:{owner}:{request.full_path}"
+            view_tags = tags() if callable(tags) else (tags or ())
+            built = False
+
+            def build():
+                nonlocal built
+                built = True
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    raise _Uncacheable(response)
+                return response.get_data(), response.mimetype
+
+            try:
+                body, mimetype = cache.get_or_set(key, build, view_tags, ttl)
+            except _Uncacheable as exc:
+                return exc.response
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers["X-Cache"] = "MISS" if built else "HIT"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def init_cache(app) -> Cache:
+    cache.configure(
+        app.config["CACHE_BACKEND"],
+        app.config["CACHE_DEFAULT_TTL"],
+        app.config["CACHE_MAX_ENTRIES"],
+        app.config["CACHE_DIR"],
+        app.config["CACHE_TAG_SYNC_INTERVAL"],
+    )
+    return cache
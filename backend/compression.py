@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import gzip
+import threading
+import time
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # 没装 brotli 时只用 gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = {"application/json", "text/plain", "text/csv", "application/x-ndjson"}
+
+
+class CompressionStats:
+    """按编码统计压缩前后字节数与压缩耗费的 CPU 时间。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: dict[str, dict] = {}
+        self.skipped = 0
+
+    def record(self, encoding: str, raw: int, packed: int, cpu: float) -> None:
+        with self._lock:
+            entry = self._data.setdefault(
+                encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0}
+            )
+            entry["responses"] += 1
+            entry["bytes_in"] += raw
+            entry["bytes_out"] += packed
+            entry["cpu_seconds"] += cpu
+
+    def skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            encodings = {}
+            for encoding, entry in self._data.items():
+                encodings[encoding] = {
+                    **entry,
+                    "cpu_seconds": round(entry["cpu_seconds"], 6),
+                    "ratio": round(entry["bytes_out"] / entry["bytes_in"], 4) if entry["bytes_in"] else 0.0,
+                    "cpu_ms_per_response": round(entry["cpu_seconds"] * 1000 / entry["responses"], 4),
+                }
+            return {"encodings": encodings, "skipped_small": self.skipped}
+
+
+compression_stats = CompressionStats()
+
+
+def choose_encoding() -> str | None:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] > 0:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    config = current_app.config
+    # 只处理 /api/ 下完整、未编码、可压缩的响应；304、流式、文件直传都跳过
+    if not config["API_COMPRESSION"] or not request.path.startswith("/api/"):
+        return response
+    if response.status_code < 200 or response.status_code in {204, 304}:
+        return response
+    if response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < config["API_COMPRESSION_MIN_BYTES"]:
+        compression_stats.skip()
+        return response
+
+    start = time.thread_time()
+    if encoding == "br":
+        packed = brotli.compress(body, quality=config["API_COMPRESSION_BROTLI_QUALITY"])
+    else:
+        packed = gzip.compress(body, compresslevel=config["API_COMPRESSION_GZIP_LEVEL"], mtime=0)
+    cpu = time.thread_time() - start
+    compression_stats.record(encoding, len(body), len(packed), cpu)
+
+    response.set_data(packed)
+    response.headers["Content-Encoding"] = encoding
+    # 压缩后字节变了，强 ETag 降为弱 ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    response.headers.add("Server-Timing", f"compress;dur={cpu * 1000:.3f}")
+    return response
+
+
+def init_compression(app) -> None:
+    app.after_request(compress_response)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# 数据库引擎配置档：auto 按连接串的数据库类型选，none 保持 SQLAlchemy 默认
+#   sqlite：连接建立时设置 WAL、busy_timeout、synchronous、mmap、cache 等 pragma
+#   mysql：连接池大小、溢出、定期回收与取用前 ping，避免空闲后拿到已被服务端断开的连接
+PROFILES = {"auto", "sqlite", "mysql", "none"}
+
+
+def resolve_profile(config, uri: str) -> str:
+    profile = config["DB_ENGINE_PROFILE"]
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE: {profile}")
+    if profile == "auto":
+        backend = make_url(uri).get_backend_name()
+        return backend if backend in {"sqlite", "mysql"} else "none"
+    return profile
+
+
+def engine_options(config, uri: str) -> dict:
+    """按配置档返回 create_engine 的参数（SQLALCHEMY_ENGINE_OPTIONS / 各 bind 的选项）。"""
+    profile = resolve_profile(config, uri)
+    if profile == "sqlite":
+        # 驱动层的等锁超时与 busy_timeout 保持一致
+        return {"connect_args": {"timeout": config["SQLITE_BUSY_TIMEOUT_MS"] / 1000}}
+    if profile == "mysql":
+        return {
+            "pool_size": config["DB_POOL_SIZE"],
+            "max_overflow": config["DB_MAX_OVERFLOW"],
+            "pool_timeout": config["DB_POOL_TIMEOUT"],
+            "pool_recycle": config["DB_POOL_RECYCLE"],
+            "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        }
+    return {}
+
+
+def sqlite_pragmas(config) -> list[str]:
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        # 负数表示以 KiB 为单位
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+    ]
+
+
+def apply_sqlite_profile(engine, config) -> None:
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def init_engine_profiles(app, db) -> dict[str, str]:
+    """给已创建的各个引擎挂上连接钩子，返回 {bind: 配置档}。需在 db.init_app 之后调用。"""
+    applied = {}
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            profile = resolve_profile(app.config, engine.url.render_as_string(hide_password=False))
+            if profile == "sqlite":
+                apply_sqlite_profile(engine, app.config)
+            applied[bind or "default"] = profile
+    app.extensions["db_profiles"] = applied
+    return applied
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import contextlib
+import itertools
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+# 读写分离：GET/HEAD 请求里的 SELECT 走只读副本，其余（写、带锁读、请求外的后台任务）走主库。
+# 用户写过之后的一小段时间内（记在会话 cookie 里），该用户的读也留在主库，保证读到自己刚写的内容。
+REPLICA_PREFIX = "replica"
+STRATEGIES = {"round_robin", "least_loaded"}
+READ_METHODS = {"GET", "HEAD"}
+STICKY_KEY = "_db_primary_until"
+
+
+def replica_binds(uris: list[str]) -> dict[str, str]:
+    return {f"{REPLICA_PREFIX}{i}": uri for i, uri in enumerate(uris)}
+
+
+def _checked_out(engine) -> int:
+    # 只有 QueuePool 能报告借出的连接数，其他连接池按 0 处理
+    checkedout = getattr(engine.pool, "checkedout", None)
+    return checkedout() if checkedout else 0
+
+
+class ReplicaRouter:
+    def __init__(self, binds: list[str], strategy: str, sticky_seconds: float):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown DB_REPLICA_STRATEGY: {strategy}")
+        self.binds = binds
+        self.strategy = strategy
+        self.sticky_seconds = sticky_seconds
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self._reads: Counter[str] = Counter()
+
+    def pick(self, engines) -> str:
+        start = next(self._turn) % len(self.binds)
+        if self.strategy == "least_loaded":
+            # 从轮到的副本开始比较，负载相同时仍然轮流
+            order = self.binds[start:] + self.binds[:start]
+            return min(order, key=lambda bind: _checked_out(engines[bind]))
+        return self.binds[start]
+
+    def record(self, target: str) -> None:
+        with self._lock:
+            self._reads[target] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            reads = dict(self._reads)
+        return {
+            "replicas": self.binds,
+            "strategy": self.strategy,
+            "sticky_seconds": self.sticky_seconds,
+            "reads": reads,
+        }
+
+
+def _read_target(router: ReplicaRouter, clause, engines) -> str | None:
+    """当前查询应读的副本 bind；返回 None 表示留在主库。"""
+    if not isinstance(clause, Select) or clause._for_update_arg is not None:
+        return None
+    if clause.get_execution_options().get("use_primary") or g.get("_db_primary_depth"):
+        return None
+    if request.method not in READ_METHODS or g.get("_db_wrote"):
+        return None
+    if session.get(STICKY_KEY, 0) > time.time():
+        return None
+    # 同一个请求内固定读一个副本，避免前后两条查询看到不同的复制进度
+    if "_db_replica" not in g:
+        g._db_replica = router.pick(engines)
+    return g._db_replica
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """块内的查询都读主库，可嵌套。用于读出的结果会被长期保存的场合（如缓存重建）。"""
+    if not has_request_context():
+        # 请求之外本来就全部走主库
+        yield
+        return
+    depth = g.get("_db_primary_depth", 0)
+    g._db_primary_depth = depth + 1
+    try:
+        yield
+    finally:
+        g._db_primary_depth = depth
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            router: ReplicaRouter | None = current_app.extensions.get("db_router")
+            if self._flushing or isinstance(clause, UpdateBase):
+                g._db_wrote = True
+            elif router is not None and isinstance(clause, Select):
+                target = _read_target(router, clause, self._db.engines)
+                router.record(target or "primary")
+                if target is not None:
+                    return self._db.engines[target]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def stick_to_primary(response):
+    # 本次请求写过库：之后 sticky_seconds 内该用户的读都走主库
+    router: ReplicaRouter | None = current_app.extensions.get("db_router")
+    if router is not None and g.get("_db_wrote"):
+        session[STICKY_KEY] = time.time() + router.sticky_seconds
+    return response
+
+
+def init_replicas(app) -> ReplicaRouter | None:
+    binds = [bind for bind in app.config.get("SQLALCHEMY_BINDS", {}) if bind.startswith(REPLICA_PREFIX)]
+    if not binds:
+        return None
+    router = ReplicaRouter(
+        binds, app.config["DB_REPLICA_STRATEGY"], app.config["DB_REPLICA_STICKY_SECONDS"]
+    )
+    app.extensions["db_router"] = router
+    app.after_request(stick_to_primary)
+    return router
+
+
+def copy_sqlite_replicas(app) -> list[str]:
+    """本地开发用：把主库 SQLite 文件整体复制到各个副本文件，模拟一次复制。"""
+    primary = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    if primary.get_backend_name() != "sqlite":
+        raise ValueError("sync-replicas only supports SQLite")
+    copied = []
+    source = sqlite3.connect(primary.database)
+    try:
+        for bind, options in app.config.get("SQLALCHEMY_BINDS", {}).items():
+            if not bind.startswith(REPLICA_PREFIX):
+                continue
+            target = make_url(options["url"] if isinstance(options, dict) else options)
+            if target.get_backend_name() != "sqlite":
+                continue
+            dest = sqlite3.connect(target.database)
+            try:
+                source.backup(dest)
+            finally:
+                dest.close()
+            copied.append(target.database)
+    finally:
+        source.close()
+    return copied
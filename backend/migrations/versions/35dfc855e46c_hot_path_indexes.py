@@ -0,0 +1,42 @@
+"""hot path indexes
+
+- note(user_id, is_pinned, updated_at, id)：笔记列表按用户过滤、按置顶/更新时间/id 排序（含游标分页）
+- note_tags(tag_id)：主键是 (note_id, tag_id)，按标签反查笔记、标签计数、删标签级联都要靠它
+- tag(user_id)：唯一约束是 (name, user_id)，按用户列标签用不上
+- password_reset_request(status, created_at)：后台按状态筛选并按时间翻页
+
+Revision ID: 35dfc855e46c
+Revises: 82f0684feeae
+Create Date: 2026-10-18 19:55:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '35dfc855e46c'
+down_revision = '82f0684feeae'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_note_user_pinned_updated', 'note', ['user_id', 'is_pinned', 'updated_at', 'id'], unique=False
+    )
+    op.create_index('ix_note_tags_tag_id', 'note_tags', ['tag_id'], unique=False)
+    op.create_index('ix_tag_user_id', 'tag', ['user_id'], unique=False)
+    op.create_index(
+        'ix_password_reset_request_status_created',
+        'password_reset_request',
+        ['status', 'created_at'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_password_reset_request_status_created', table_name='password_reset_request')
+    op.drop_index('ix_tag_user_id', table_name='tag')
+    op.drop_index('ix_note_tags_tag_id', table_name='note_tags')
+    op.drop_index('ix_note_user_pinned_updated', table_name='note')
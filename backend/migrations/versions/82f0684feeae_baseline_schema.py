@@ -0,0 +1,184 @@
+"""baseline schema
+
+取代原来每次启动都跑的 ensure_sqlite_schema()：
+- 空库：按当前结构建表；
+- 旧库（create_all 建的，可能缺后加的列）：只建缺的表、补缺的列，NULL 回填只在这里跑一次。
+
+Revision ID: 82f0684feeae
+Revises:
+Create Date: 2026-10-18 19:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '82f0684feeae'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# 旧库可能缺的列：(表, 列, 回填 NULL 的值)
+LEGACY_COLUMNS = [
+    ("user", sa.Column("role", sa.String(length=20), nullable=False, server_default="user"), "user"),
+    ("user", sa.Column("active", sa.Boolean(), nullable=False, server_default=sa.true()), True),
+    ("user", sa.Column("display_name", sa.String(length=80), nullable=False, server_default=""), ""),
+    ("user", sa.Column("phone", sa.String(length=30), nullable=False, server_default=""), ""),
+    ("user", sa.Column("bio", sa.String(length=280), nullable=False, server_default=""), ""),
+    # MySQL 8.0.13 之前 TEXT 列不能带 DEFAULT：按新建表的定义允许 NULL，加列后用 UPDATE 回填
+    ("user", sa.Column("avatar_url", sa.Text(), nullable=True), ""),
+    ("note", sa.Column("excerpt", sa.String(length=200), nullable=False, server_default=""), None),
+    ("note", sa.Column("content_length", sa.Integer(), nullable=False, server_default="0"), None),
+    ("note", sa.Column("content_hash", sa.String(length=40), nullable=False, server_default=""), None),
+    ("note", sa.Column("version", sa.Integer(), nullable=False, server_default="1"), None),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    def create_table(name, *columns, **kw):
+        if name not in existing:
+            op.create_table(name, *columns, **kw)
+            return True
+        return False
+
+    if create_table(
+        'user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password_hash', sa.String(length=225), nullable=False),
+        sa.Column('display_name', sa.String(length=80), nullable=True),
+        sa.Column('phone', sa.String(length=30), nullable=True),
+        sa.Column('bio', sa.String(length=280), nullable=True),
+        sa.Column('avatar_url', sa.Text(), nullable=True),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    ):
+        op.create_index('ix_user_email', 'user', ['email'], unique=True)
+    create_table(
+        'tag',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('color', sa.String(length=7), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', 'user_id', name='unique_user_tag'),
+    )
+    create_table(
+        'note',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=True),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('excerpt', sa.String(length=200), nullable=False),
+        sa.Column('content_length', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=40), nullable=False),
+        sa.Column('is_pinned', sa.Boolean(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create_table(
+        'note_tags',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['note.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('note_id', 'tag_id'),
+    )
+    create_table(
+        'announcement',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    create_table(
+        'password_reset_request',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    if create_table(
+        'import_job',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('imported', sa.Integer(), nullable=False),
+        sa.Column('skipped', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    ):
+        op.create_index('ix_import_job_user_id', 'import_job', ['user_id'], unique=False)
+    create_table(
+        'stat_counter',
+        sa.Column('key', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    create_table(
+        'daily_stat',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('metric', sa.String(length=30), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'metric'),
+    )
+    if create_table(
+        'user_stat',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('note_count', sa.Integer(), nullable=False),
+        sa.Column('last_note_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    ):
+        op.create_index('ix_user_stat_note_count', 'user_stat', ['note_count'], unique=False)
+    create_table(
+        'cache_version',
+        sa.Column('key', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+
+    # 旧库补列；老代码建的列允许 NULL，这里一次性回填
+    for table_name, column, fill in LEGACY_COLUMNS:
+        if table_name not in existing:
+            continue
+        columns = {c['name'] for c in inspector.get_columns(table_name)}
+        if column.name not in columns:
+            op.add_column(table_name, column)
+            if column.server_default is not None:
+                continue
+        if fill is not None:
+            table = sa.table(table_name, sa.column(column.name))
+            op.execute(
+                table.update().where(table.c[column.name].is_(None)).values({column.name: fill})
+            )
+
+
+def downgrade():
+    for name in (
+        'cache_version', 'user_stat', 'daily_stat', 'stat_counter', 'import_job',
+        'password_reset_request', 'announcement', 'note_tags', 'note', 'tag', 'user',
+    ):
+        op.drop_table(name)
@@ -1,10 +1,18 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import datetime
 
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy import event
+from sqlalchemy.orm import Session, validates
 
+from cache import cache, user_tag
 from extensions import db, login_manager
+from passwords import PasswordHasherBusy, password_hasher
+from textutil import EXCERPT_LENGTH, content_hash as hash_content, make_excerpt
+from user_cache import user_cache
+
+USER_CACHE_KEY = "users"
 
 
 class User(db.Model):
@@ -20,10 +28,20 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
 
     def set_password(self, pwd: str) -> None:
-        self.password_hash = generate_password_hash(pwd)
+        self.password_hash = password_hasher.hash(pwd)
 
     def check_password(self, pwd: str) -> bool:
-        return check_password_hash(self.password_hash, pwd)
+        return password_hasher.verify(self.password_hash, pwd)
+
+    def rehash_password(self, pwd: str) -> bool:
+        # 登录成功后调用：哈希参数落后于当前配置时用明文重新生成；忙时下次再说
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        try:
+            self.set_password(pwd)
+        except PasswordHasherBusy:
+            return False
+        return True
 
     @property
     def is_active(self) -> bool:
@@ -45,7 +63,9 @@ class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     color = db.Column(db.String(7), default="#007bff")
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True
+    )
     created_at = db.Column(db.DateTime, default=datetime.now)
 
     user = db.relationship("User", backref="tags")
@@ -56,6 +76,8 @@ note_tags = db.Table(
     "note_tags",
     db.Column("note_id", db.Integer, db.ForeignKey("note.id", ondelete="CASCADE"), primary_key=True),
     db.Column("tag_id", db.Integer, db.ForeignKey("tag.id", ondelete="CASCADE"), primary_key=True),
+    # 主键以 note_id 开头，按标签反查笔记要单独的索引
+    db.Index("ix_note_tags_tag_id", "tag_id"),
 )
 
 
@@ -64,13 +86,31 @@ class Note(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
     title = db.Column(db.String(200), default="")
     content = db.Column(db.Text, default="")
+    # 列表页只需要摘要：content 写入时同步算好，列表查询可以 defer 掉 content
+    excerpt = db.Column(db.String(EXCERPT_LENGTH), default="", nullable=False)
+    content_length = db.Column(db.Integer, default=0, nullable=False)
+    content_hash = db.Column(db.String(40), default=hash_content(""), nullable=False)
     is_pinned = db.Column(db.Boolean, default=False)
+    # 乐观锁：每次 UPDATE 自增，带旧版本号的写入会失败
+    version = db.Column(db.Integer, default=1, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __mapper_args__ = {"version_id_col": version}
+    # 列表页按用户过滤、按 (is_pinned, updated_at, id) 排序/翻页，整条走这个索引
+    __table_args__ = (db.Index("ix_note_user_pinned_updated", "user_id", "is_pinned", "updated_at", "id"),)
+
     user = db.relationship("User", backref="notes")
     tags = db.relationship("Tag", secondary=note_tags, backref="notes")
 
+    @validates("content")
+    def _sync_content_digest(self, key: str, value: str | None) -> str:
+        value = value or ""
+        self.excerpt = make_excerpt(value)
+        self.content_length = len(value)
+        self.content_hash = hash_content(value)
+        return value
+
 
 class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -90,10 +130,148 @@ class PasswordResetRequest(db.Model):
     status = db.Column(db.String(20), default="pending", nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
 
+    __table_args__ = (db.Index("ix_password_reset_request_status_created", "status", "created_at"),)
+
+
+class ImportJob(db.Model):
+    # 后台导入任务的进度；放在库里，任意 worker 都能查询
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
+    format = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), default="pending", nullable=False)
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    imported = db.Column(db.Integer, default=0, nullable=False)
+    skipped = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, default="")
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class StatCounter(db.Model):
+    # 后台统计的汇总计数（用户总数、笔记总数等），写路径随业务事务增量维护
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+
+class DailyStat(db.Model):
+    # 按天的计数桶，例如每天新建的笔记数
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+
+class UserStat(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    note_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+    last_note_at = db.Column(db.DateTime)
+
+
+class CacheVersion(db.Model):
+    # 跨 worker 的缓存版本号：写路径自增，各 worker 发现版本变化就丢掉本地缓存
+    key = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+    @classmethod
+    def current(cls, key: str) -> int:
+        # 版本号决定各 worker 何时丢缓存，读主库，不受副本复制延迟影响
+        stmt = db.select(cls.version).where(cls.key == key).execution_options(use_primary=True)
+        return db.session.scalar(stmt) or 0
+
+    @classmethod
+    def bump(cls, key: str) -> None:
+        result = db.session.execute(
+            db.update(cls).where(cls.key == key).values(version=cls.version + 1)
+        )
+        if result.rowcount == 0:
+            db.session.add(cls(key=key, version=1))
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    email: str
+    role: str
+    active: bool
+
+
+class CachedUser:
+    """current_user 的轻量代理：id/email/role/active 取自缓存快照，其余字段首次访问时才查库。"""
+
+    def __init__(self, snapshot: UserSnapshot):
+        object.__setattr__(self, "_snapshot", snapshot)
+        object.__setattr__(self, "_user", None)
+
+    def _load(self) -> User:
+        if self._user is None:
+            user = load_user_row(self._snapshot.id)
+            if user is None:
+                raise AttributeError("user no longer exists")
+            object.__setattr__(self, "_user", user)
+        return self._user
+
+    def __getattr__(self, name: str):
+        if self._user is None and name in {"id", "email", "role", "active"}:
+            return getattr(self._snapshot, name)
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._load(), name, value)
+
+    @property
+    def is_active(self) -> bool:
+        return self.active
+
+    @property
+    def is_authenticated(self) -> bool:
+        return True
+
+    @property
+    def is_anonymous(self) -> bool:
+        return False
+
+    def get_id(self) -> str:
+        return str(self.id)
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    # 在写事务里调用：版本号随业务数据一起提交；本进程在提交后失效（见下面的 after_commit），
+    # 其他 worker 在下一次同步时发现版本变化
+    CacheVersion.bump(USER_CACHE_KEY)
+    db.session.info.setdefault("user_cache_ids", set()).add(user_id)
+    cache.invalidate(user_tag(user_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session) -> None:
+    # 提交前失效的话，并发请求可能又把提交前的旧行写回缓存
+    for user_id in session.info.pop("user_cache_ids", ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_users(session) -> None:
+    session.info.pop("user_cache_ids", None)
+
+
+def load_user_row(user_id: int) -> User | None:
+    # 鉴权用的用户行一律读主库：副本可能还没复制到停用/改角色，读到的旧行还会被写进快照缓存
+    stmt = db.select(User).where(User.id == user_id).execution_options(use_primary=True)
+    return db.session.scalars(stmt).first()
+
 
 @login_manager.user_loader
 def load_user(user_id: str):
-    user = User.query.get(int(user_id))
-    if user and not user.active:
+    uid = int(user_id)
+    user_cache.sync(lambda: CacheVersion.current(USER_CACHE_KEY))
+    snapshot = user_cache.get(uid)
+    if snapshot is None:
+        # 读库前记下 generation：读的过程中该用户被失效的话，读到的旧行不写回缓存
+        generation = user_cache.generation()
+        user = load_user_row(uid)
+        if user is None:
+            return None
+        user_cache.put(uid, UserSnapshot(user.id, user.email, user.role, user.active), generation=generation)
+        return user if user.active else None
+    if not snapshot.active:
         return None
-    return user
+    return CachedUser(snapshot)
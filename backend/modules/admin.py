@@ -1,13 +1,26 @@
+import base64
+import json
+from datetime import datetime
 from functools import wraps
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_login import current_user, login_required
+from sqlalchemy import func, select, tuple_
 
+import stats
+from cache import cache
+from compression import compression_stats
 from extensions import db
-from models import Announcement, PasswordResetRequest, User
+from models import Announcement, Note, PasswordResetRequest, Tag, User, invalidate_user_cache
+from modules.announcements import invalidate_announcements
+from user_cache import user_cache
 
 bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 
+# 后台列表统一按 (created_at, id) 倒序做 keyset 分页
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 
 def admin_required(func):
     @wraps(func)
@@ -20,10 +33,100 @@ def admin_required(func):
     return wrapper
 
 
+def encode_cursor(row) -> str:
+    key = [row.created_at.isoformat(), row.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(raw: str) -> tuple[datetime, int]:
+    try:
+        padded = raw + "=" * (-len(raw) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def parse_bool(raw: str | None) -> bool | None:
+    if raw is None or raw == "":
+        return None
+    return raw.lower() in {"1", "true", "yes"}
+
+
+def email_prefix(query, column):
+    # 常量前缀的 LIKE：SQLite 与 MySQL（*_ci 排序规则）都不区分大小写，两边结果一致；
+    # MySQL 按区间走 email 索引。通配符转义掉，用户输入的 % / _ 按字面匹配
+    prefix = (request.args.get("q") or "").strip()
+    if prefix:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(column.like(escaped + "%", escape="\\"))
+    return query
+
+
+def keyset_page(query, model):
+    """按 cursor / per_page 取一页，返回 (rows, next_cursor, per_page)；cursor 非法时抛 ValueError。"""
+    per_page = min(max(request.args.get("per_page", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    raw = request.args.get("cursor", "")
+    if raw:
+        created_at, row_id = decode_cursor(raw)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    return rows, (encode_cursor(rows[-1]) if has_more else None), per_page
+
+
+def user_aggregates(user_ids: list[int]) -> dict[int, dict]:
+    # 一条语句：笔记数、最近活动时间、标签数各用一个分组子查询，按本页用户 id 过滤
+    if not user_ids:
+        return {}
+    notes = (
+        select(
+            Note.user_id,
+            func.count(Note.id).label("note_count"),
+            func.max(Note.updated_at).label("last_activity"),
+        )
+        .where(Note.user_id.in_(user_ids))
+        .group_by(Note.user_id)
+        .subquery()
+    )
+    tags = (
+        select(Tag.user_id, func.count(Tag.id).label("tag_count"))
+        .where(Tag.user_id.in_(user_ids))
+        .group_by(Tag.user_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(User.id, notes.c.note_count, notes.c.last_activity, tags.c.tag_count)
+        .outerjoin(notes, notes.c.user_id == User.id)
+        .outerjoin(tags, tags.c.user_id == User.id)
+        .where(User.id.in_(user_ids))
+    )
+    return {
+        r.id: {
+            "note_count": r.note_count or 0,
+            "tag_count": r.tag_count or 0,
+            "last_activity": r.last_activity.isoformat() if r.last_activity else None,
+        }
+        for r in rows
+    }
+
+
 @bp.get("/users")
 @admin_required
 def list_users():
-    users = User.query.order_by(User.created_at.desc()).all()
+    query = email_prefix(User.query, User.email)
+    role = request.args.get("role")
+    if role:
+        query = query.filter(User.role == role)
+    active = parse_bool(request.args.get("active"))
+    if active is not None:
+        query = query.filter(User.active == active)
+    try:
+        users, next_cursor, per_page = keyset_page(query, User)
+    except ValueError:
+        return jsonify(error="Invalid cursor"), 400
+
     payload = [
         {
             "id": u.id,
@@ -34,7 +137,11 @@ def list_users():
         }
         for u in users
     ]
-    return jsonify(users=payload)
+    if parse_bool(request.args.get("with_stats")):
+        aggregates = user_aggregates([u.id for u in users])
+        for item in payload:
+            item.update(aggregates.get(item["id"], {}))
+    return jsonify(users=payload, next_cursor=next_cursor, per_page=per_page)
 
 
 @bp.post("/users/<int:user_id>/reset-password")
@@ -46,6 +153,7 @@ def reset_user_password(user_id: int):
         return jsonify(error="Missing password"), 400
     user = User.query.get_or_404(user_id)
     user.set_password(new_password)
+    invalidate_user_cache(user.id)
     db.session.commit()
     return jsonify(message="ok")
 
@@ -57,14 +165,65 @@ def toggle_user_active(user_id: int):
     if user.id == current_user.id:
         return jsonify(error="Cannot disable your own account"), 400
     user.active = not user.active
+    invalidate_user_cache(user.id)
+    stats.user_active_changed(user.active)
     db.session.commit()
     return jsonify(message="ok", is_active=user.active)
 
 
+@bp.get("/user-cache")
+@admin_required
+def user_cache_stats():
+    return jsonify(user_cache.stats())
+
+
+@bp.get("/stats")
+@admin_required
+def stats_overview():
+    days = min(max(request.args.get("days", 30, type=int), 1), 366)
+    top = min(max(request.args.get("top", 10, type=int), 1), 100)
+    return jsonify(stats.overview(days, top))
+
+
+@bp.post("/stats/rebuild")
+@admin_required
+def rebuild_stats():
+    # 对账：从业务表重新统计，修正增量计数的漂移
+    counters = stats.rebuild_stats()
+    db.session.commit()
+    return jsonify(message="ok", **counters)
+
+
+@bp.get("/cache")
+@admin_required
+def cache_stats():
+    return jsonify(cache.stats())
+
+
+@bp.get("/db-routing")
+@admin_required
+def db_routing_stats():
+    router = current_app.extensions.get("db_router")
+    return jsonify(router.stats() if router else {"replicas": [], "reads": {}})
+
+
+@bp.get("/compression")
+@admin_required
+def compression_stats_view():
+    return jsonify(compression_stats.snapshot())
+
+
 @bp.get("/announcements")
 @admin_required
 def list_announcements():
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).all()
+    query = Announcement.query
+    active = parse_bool(request.args.get("active"))
+    if active is not None:
+        query = query.filter(Announcement.is_active == active)
+    try:
+        announcements, next_cursor, per_page = keyset_page(query, Announcement)
+    except ValueError:
+        return jsonify(error="Invalid cursor"), 400
     payload = [
         {
             "id": a.id,
@@ -76,13 +235,20 @@ def list_announcements():
         }
         for a in announcements
     ]
-    return jsonify(announcements=payload)
+    return jsonify(announcements=payload, next_cursor=next_cursor, per_page=per_page)
 
 
 @bp.get("/password-resets")
 @admin_required
 def list_password_resets():
-    resets = PasswordResetRequest.query.order_by(PasswordResetRequest.created_at.desc()).all()
+    query = email_prefix(PasswordResetRequest.query, PasswordResetRequest.email)
+    status = request.args.get("status")
+    if status:
+        query = query.filter(PasswordResetRequest.status == status)
+    try:
+        resets, next_cursor, per_page = keyset_page(query, PasswordResetRequest)
+    except ValueError:
+        return jsonify(error="Invalid cursor"), 400
     payload = [
         {
             "id": r.id,
@@ -92,7 +258,7 @@ def list_password_resets():
         }
         for r in resets
     ]
-    return jsonify(resets=payload)
+    return jsonify(resets=payload, next_cursor=next_cursor, per_page=per_page)
 
 
 @bp.post("/announcements")
@@ -110,6 +276,7 @@ def create_announcement():
     announcement.is_active = bool(is_active)
     announcement.created_by = current_user.id
     db.session.add(announcement)
+    invalidate_announcements()
     db.session.commit()
     return jsonify(message="ok", id=announcement.id), 201
 
@@ -133,6 +300,7 @@ def update_announcement(announcement_id: int):
     if "is_active" in data:
         announcement.is_active = bool(data.get("is_active"))
 
+    invalidate_announcements()
     db.session.commit()
     return jsonify(message="ok")
 
@@ -142,5 +310,6 @@ def update_announcement(announcement_id: int):
 def delete_announcement(announcement_id: int):
     announcement = Announcement.query.get_or_404(announcement_id)
     db.session.delete(announcement)
+    invalidate_announcements()
     db.session.commit()
     return jsonify(message="ok")
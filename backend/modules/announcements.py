@@ -1,12 +1,23 @@
-from flask import Blueprint, jsonify
+import hashlib
 
+from flask import Blueprint, current_app, request
+
+from cache import ANNOUNCEMENTS_TAG, cache
 from models import Announcement
 
 bp = Blueprint("announcements", __name__, url_prefix="/api/announcements")
 
+# 公开公告接口的预序列化快照，放在缓存层里，管理员改动时按标签失效
+SNAPSHOT_KEY = "announcements:snapshot"
+SNAPSHOT_TTL = 3600
 
-@bp.get("/")
-def list_active_announcements():
+
+def invalidate_announcements() -> None:
+    # 在管理员写事务里调用，提交后各 worker 下次请求都会重建
+    cache.invalidate(ANNOUNCEMENTS_TAG)
+
+
+def build_snapshot() -> dict:
     announcements = (
         Announcement.query.filter_by(is_active=True)
         .order_by(Announcement.created_at.desc())
@@ -21,4 +32,19 @@ def list_active_announcements():
         }
         for a in announcements
     ]
-    return jsonify(announcements=payload)
+    body = current_app.json.dumps({"announcements": payload}).encode("utf-8")
+    return {"body": body, "etag": hashlib.sha256(body).hexdigest()[:32]}
+
+
+@bp.get("/")
+def list_active_announcements():
+    snapshot = cache.get_or_set(SNAPSHOT_KEY, build_snapshot, [ANNOUNCEMENTS_TAG], SNAPSHOT_TTL)
+
+    # 压缩中间件会把 ETag 降为弱 ETag，If-None-Match 按弱比较
+    if request.if_none_match.contains_weak(snapshot["etag"]):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(snapshot["body"], mimetype="application/json")
+    response.set_etag(snapshot["etag"])
+    response.cache_control.no_cache = True
+    return response
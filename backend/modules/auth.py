@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from flask_login import current_user, login_required, login_user, logout_user
 
+import stats
 from extensions import db
 from models import User
 
@@ -21,6 +22,8 @@ def register():
     u = User(email=email, role="user")  # type: ignore[call-arg]
     u.set_password(password)
     db.session.add(u)
+    db.session.flush()
+    stats.user_registered(u)
     db.session.commit()
     return jsonify(message="ok")
 
@@ -35,6 +38,8 @@ def login():
         return jsonify(error="Invalid email or password"), 401
     if not u.active:
         return jsonify(error="Account disabled"), 403
+    if u.rehash_password(password):
+        db.session.commit()
     login_user(u, remember=remember)
     return jsonify(message="ok", user={"id": u.id, "email": u.email, "role": u.role})
 
@@ -0,0 +1,23 @@
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+
+from extensions import db
+
+bp = Blueprint("health", __name__, url_prefix="/api/health")
+
+
+@bp.get("/")
+def live():
+    # 存活检查：进程能处理请求即可，不碰数据库
+    return jsonify(status="ok")
+
+
+@bp.get("/ready")
+def ready():
+    # 就绪检查：数据库可用才接流量
+    try:
+        db.session.execute(text("SELECT 1"))
+    except Exception:  # noqa: BLE001
+        db.session.rollback()
+        return jsonify(status="unavailable", database="error"), 503
+    return jsonify(status="ok", database="ok")
@@ -1,7 +1,20 @@
-from flask import Blueprint, request
+from dataclasses import asdict
+
+from flask import Blueprint, current_app, jsonify, request
 from flask_login import login_required
 
-from tools.koculator import calc_expr
+from tools.koculator import (
+    CalcError,
+    cache_stats,
+    calc_expr,
+    calc_many,
+    compile_expr,
+    current_limits,
+    evaluate_exact,
+    evaluate_vector,
+    record_rejections,
+    rejection_stats,
+)
 
 bp = Blueprint("koculator", __name__, url_prefix="/api/tools/koculator")
 
@@ -13,3 +26,58 @@ def calc():
     expr = payload.get("expr", "")
     return calc_expr(expr)
 
+
+@bp.post("/calc-batch")
+@login_required
+def calc_batch():
+    max_items = current_app.config["KOCULATOR_BATCH_MAX_ITEMS"]
+    max_bytes = current_app.config["KOCULATOR_BATCH_MAX_BYTES"]
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify(ok=False, error="Request too large"), 413
+
+    payload = request.get_json(silent=True) or {}
+    exprs = payload.get("exprs")
+    if not isinstance(exprs, list):
+        return jsonify(ok=False, error="Missing exprs"), 400
+    if len(exprs) > max_items:
+        return jsonify(ok=False, error=f"Too many expressions (max {max_items})"), 413
+
+    results = calc_many(
+        exprs,
+        parallel_threshold=current_app.config["KOCULATOR_PARALLEL_THRESHOLD"],
+    )
+    return jsonify(ok=True, results=results)
+
+
+@bp.post("/calc-vector")
+@login_required
+def calc_vector():
+    # 一个含变量的表达式（如 x * 1.13 - y）套用到整列数据上
+    payload = request.get_json(silent=True) or {}
+    expr = payload.get("expr", "")
+    variables = payload.get("vars") or {}
+    max_len = current_app.config["KOCULATOR_VECTOR_MAX_LEN"]
+    if isinstance(variables, dict) and any(
+        isinstance(col, list) and len(col) > max_len for col in variables.values()
+    ):
+        return jsonify(ok=False, error=f"Too many values (max {max_len})"), 413
+
+    try:
+        program = compile_expr(expr) if isinstance(expr, str) else compile_expr("")
+        if payload.get("exact"):
+            results, div_by_zero = evaluate_exact(program, variables)
+        else:
+            results, div_by_zero = evaluate_vector(program, variables)
+    except CalcError as exc:
+        record_rejections([exc.code])
+        return jsonify(ok=False, error=str(exc), code=exc.code), 400
+    return jsonify(ok=True, results=results, div_by_zero=div_by_zero)
+
+
+@bp.get("/stats")
+@login_required
+def stats():
+    stats = cache_stats()
+    stats["limits"] = asdict(current_limits())
+    stats["rejected"] = rejection_stats()
+    return jsonify(stats)
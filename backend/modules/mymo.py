@@ -1,13 +1,81 @@
-from flask import Blueprint, jsonify, request
+import base64
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from flask_login import current_user, login_required
-from sqlalchemy import or_
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.orm import defer, selectinload
+from sqlalchemy.orm.exc import StaleDataError
 
+import stats
+from cache import cache, cached_view, note_tags_tag
 from extensions import db
-from models import Note, Tag
+from models import ImportJob, Note, Tag, note_tags
+from notes_io import export_ndjson, export_zip, start_import
+from search import apply_search, make_snippet, remove_from_index
+from textutil import apply_text_diff
 
 bp = Blueprint("mymo", __name__, url_prefix="/api/notes")
 
 
+# 批量接口一次最多处理的笔记 id 数（所有操作合计）
+BATCH_LIMIT = 1000
+BATCH_OPS = {"delete", "pin", "unpin", "add_tag", "remove_tag", "set_tags"}
+
+# 导入上传按块写入临时文件，不在内存里攒整个请求体
+UPLOAD_CHUNK_SIZE = 64 * 1024
+IMPORT_FORMATS = {"application/x-ndjson": "ndjson", "application/zip": "zip"}
+
+# 游标模式下 count=approx 最多数到这么多行，超过就只返回下限
+APPROX_COUNT_LIMIT = 1000
+# 不带版本号的写接口遇到并发修改时重新加载重试的次数
+STALE_RETRIES = 3
+
+
+def serialize_note(n: Note, summary: bool = False) -> dict:
+    payload = {
+        "id": n.id,
+        "title": n.title,
+        "is_pinned": n.is_pinned,
+        "version": n.version,
+        "created_at": n.created_at.isoformat(),
+        "updated_at": n.updated_at.isoformat(),
+        "tags": [{"id": t.id, "name": t.name, "color": t.color} for t in n.tags],
+    }
+    if summary:
+        payload["excerpt"] = n.excerpt
+        payload["content_length"] = n.content_length
+        payload["content_hash"] = n.content_hash
+    else:
+        payload["content"] = n.content
+    return payload
+
+
+def render_notes(items, search: str, summary: bool) -> list[dict]:
+    notes = [serialize_note(n, summary) for n in items]
+    if search:
+        for item, n in zip(notes, items):
+            item["snippet"] = make_snippet(n.content, search)
+    return notes
+
+
+def encode_cursor(n: Note) -> str:
+    key = [int(bool(n.is_pinned)), n.updated_at.isoformat(), n.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(raw: str) -> tuple[bool, datetime, int]:
+    try:
+        padded = raw + "=" * (-len(raw) % 4)
+        pinned, updated_at, nid = json.loads(base64.urlsafe_b64decode(padded))
+        return bool(pinned), datetime.fromisoformat(updated_at), int(nid)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
 @bp.get("/")
 @login_required
 def list_notes():
@@ -16,28 +84,28 @@ def list_notes():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 10, type=int)
     per_page = max(1, min(per_page, 100))
+    # view=summary：不下发 content，只给摘要 + 长度/哈希，全文走 GET /api/notes/<id>
+    summary = request.args.get("view") == "summary"
 
-    query = Note.query.filter_by(user_id=current_user.id)
+    query = Note.query.filter_by(user_id=current_user.id).options(selectinload(Note.tags))
+    if summary and not search:
+        query = query.options(defer(Note.content))
+    rank = None
     if search:
-        query = query.filter(or_(Note.title.contains(search), Note.content.contains(search)))
+        query, rank = apply_search(query, search)
     if tag_id:
         query = query.filter(Note.tags.any(Tag.id == tag_id))
 
-    query = query.order_by(Note.is_pinned.desc(), Note.updated_at.desc())
-    pagination = db.paginate(query, page=page, per_page=per_page, error_out=False)
+    if "cursor" in request.args:
+        return list_notes_by_cursor(query, search, per_page, summary)
 
-    notes = [
-        {
-            "id": n.id,
-            "title": n.title,
-            "content": n.content,
-            "is_pinned": n.is_pinned,
-            "created_at": n.created_at.isoformat(),
-            "updated_at": n.updated_at.isoformat(),
-            "tags": [{"id": t.id, "name": t.name, "color": t.color} for t in n.tags],
-        }
-        for n in pagination.items
-    ]
+    if rank is not None:
+        query = query.order_by(rank, Note.updated_at.desc())
+    else:
+        query = query.order_by(Note.is_pinned.desc(), Note.updated_at.desc())
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+
+    notes = render_notes(pagination.items, search, summary)
 
     return jsonify(
         {
@@ -50,6 +118,47 @@ def list_notes():
     )
 
 
+def list_notes_by_cursor(query, search: str, per_page: int, summary: bool):
+    # 按 (is_pinned, updated_at, id) 做 keyset 分页：没有 OFFSET，也不必每页 COUNT；
+    # 翻页期间被编辑的笔记只会移到游标之前，不会在后续页里重复出现
+    raw = request.args.get("cursor", "")
+    count_mode = request.args.get("count", "none")
+
+    page_query = query
+    if raw:
+        try:
+            pinned, updated_at, nid = decode_cursor(raw)
+        except ValueError:
+            return jsonify(error="Invalid cursor"), 400
+        page_query = page_query.filter(
+            tuple_(Note.is_pinned, Note.updated_at, Note.id) < tuple_(pinned, updated_at, nid)
+        )
+
+    items = (
+        page_query.order_by(Note.is_pinned.desc(), Note.updated_at.desc(), Note.id.desc())
+        .limit(per_page + 1)
+        .all()
+    )
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    notes = render_notes(items, search, summary)
+
+    payload = {
+        "notes": notes,
+        "next_cursor": encode_cursor(items[-1]) if has_more else None,
+        "per_page": per_page,
+    }
+    if count_mode == "exact":
+        payload["total"] = query.order_by(None).count()
+        payload["total_exact"] = True
+    elif count_mode == "approx":
+        counted = query.order_by(None).limit(APPROX_COUNT_LIMIT + 1).count()
+        payload["total"] = min(counted, APPROX_COUNT_LIMIT)
+        payload["total_exact"] = counted <= APPROX_COUNT_LIMIT
+    return jsonify(payload)
+
+
 @bp.post("/")
 @login_required
 def create_note():
@@ -62,6 +171,10 @@ def create_note():
         n.tags = tags
 
     db.session.add(n)
+    db.session.flush()
+    stats.notes_created(current_user.id, [n.created_at])
+    if tag_ids:
+        cache.invalidate(note_tags_tag(current_user.id))
     db.session.commit()
     return (
         jsonify({"id": n.id, "tags": [{"id": t.id, "name": t.name, "color": t.color} for t in n.tags]}),
@@ -69,60 +182,318 @@ def create_note():
     )
 
 
+@bp.get("/export")
+@login_required
+def export_notes():
+    # 流式导出全部笔记与标签；after_id 从某条笔记之后继续（断点续传）
+    fmt = request.args.get("format", "ndjson")
+    try:
+        after_id = int(request.args.get("after_id", 0))
+    except ValueError:
+        return jsonify(error="Invalid after_id"), 400
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    if fmt == "ndjson":
+        body = export_ndjson(current_user.id, after_id)
+        mimetype, filename = "application/x-ndjson", f"notes-{stamp}.ndjson"
+    elif fmt == "zip":
+        body = export_zip(current_user.id, after_id)
+        mimetype, filename = "application/zip", f"notes-{stamp}.zip"
+    else:
+        return jsonify(error="Invalid format"), 400
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def serialize_import_job(job: ImportJob) -> dict:
+    return {
+        "id": job.id,
+        "format": job.format,
+        "status": job.status,
+        "processed": job.processed,
+        "imported": job.imported,
+        "skipped": job.skipped,
+        "error": job.error or "",
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+@bp.post("/import")
+@login_required
+def import_notes():
+    # 请求体直接是 NDJSON 或 zip（与导出格式相同），落盘后交给后台任务，立即返回任务 id
+    fmt = request.args.get("format") or IMPORT_FORMATS.get(request.mimetype)
+    if fmt not in {"ndjson", "zip"}:
+        return jsonify(error="Invalid format"), 400
+    max_bytes = current_app.config["NOTES_IMPORT_MAX_BYTES"]
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify(error="Upload too large"), 413
+
+    fd, path = tempfile.mkstemp(prefix="notes-import-", suffix=f".{fmt}")
+    size = 0
+    with os.fdopen(fd, "wb") as fh:
+        while chunk := request.stream.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            fh.write(chunk)
+    if size > max_bytes or size == 0:
+        os.unlink(path)
+        return (jsonify(error="Upload too large"), 413) if size else (jsonify(error="Empty upload"), 400)
+
+    job_id = start_import(current_app._get_current_object(), current_user.id, fmt, path)
+    job = db.session.get(ImportJob, job_id)
+    return jsonify(job=serialize_import_job(job)), 202
+
+
+@bp.get("/import/<job_id>")
+@login_required
+def import_status(job_id: str):
+    job = ImportJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(job=serialize_import_job(job))
+
+
+@bp.get("/<int:nid>")
+@login_required
+def get_note(nid: int):
+    n = Note.query.filter_by(id=nid, user_id=current_user.id).first_or_404()
+    return jsonify(note=serialize_note(n))
+
+
 @bp.put("/<int:nid>")
 @login_required
 def update_note(nid: int):
-    n = Note.query.filter_by(id=nid, user_id=current_user.id).first_or_404()
     data = request.get_json() or {}
 
-    n.title = data.get("title", n.title)
-    n.content = data.get("content", n.content)
-
-    if "is_pinned" in data:
-        n.is_pinned = data.get("is_pinned", False)
+    def apply(n: Note) -> None:
+        n.title = data.get("title", n.title)
+        n.content = data.get("content", n.content)
+
+        if "is_pinned" in data:
+            n.is_pinned = data.get("is_pinned", False)
+
+        if "tag_ids" in data:
+            tag_ids = data.get("tag_ids", [])
+            tags = Tag.query.filter(Tag.id.in_(tag_ids), Tag.user_id == current_user.id).all()
+            if {t.id for t in tags} != {t.id for t in n.tags}:
+                # 只改标签时笔记行本身没变，显式更新时间，版本号才会随之前进
+                n.updated_at = datetime.now()
+            n.tags = tags
+            cache.invalidate(note_tags_tag(current_user.id))
+
+    n = commit_note_change(nid, apply)
+    if n is None:
+        return version_conflict(nid)
+    return jsonify({"message": "ok", "note": serialize_note(n)})
+
+
+def commit_note_change(nid: int, apply) -> Note | None:
+    """加载笔记、apply(n) 修改后提交。不带版本号的接口保持“后写为准”：
+    加载到提交之间被别的请求改过（乐观锁报 StaleDataError）就重新加载再改一次；
+    重试几次仍冲突返回 None，笔记已被删除则 404。"""
+    for _ in range(STALE_RETRIES):
+        n = Note.query.filter_by(id=nid, user_id=current_user.id).first_or_404()
+        apply(n)
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            continue
+        return n
+    return None
+
+
+def version_conflict(nid: int):
+    db.session.rollback()
+    current = db.session.get(Note, nid)
+    return jsonify(error="Version conflict", version=current.version if current else None), 409
+
+
+@bp.patch("/<int:nid>")
+@login_required
+def patch_note(nid: int):
+    # 自动保存用的增量接口：content_diff 针对 version 对应的内容，版本过期返回 409
+    n = Note.query.filter_by(id=nid, user_id=current_user.id).first_or_404()
+    data = request.get_json() or {}
 
-    if "tag_ids" in data:
-        tag_ids = data.get("tag_ids", [])
-        tags = Tag.query.filter(Tag.id.in_(tag_ids), Tag.user_id == current_user.id).all()
-        n.tags = tags
+    version = data.get("version")
+    if not isinstance(version, int):
+        return jsonify(error="Missing version"), 400
+    if version != n.version:
+        return jsonify(error="Version conflict", version=n.version), 409
+
+    if "title" in data:
+        n.title = data.get("title") or ""
+    if "content_diff" in data:
+        try:
+            content = apply_text_diff(n.content or "", data.get("content_diff"))
+        except ValueError:
+            return jsonify(error="Invalid diff"), 400
+        if content != n.content:
+            n.content = content
+        expected_hash = data.get("content_hash")
+        if expected_hash and expected_hash != n.content_hash:
+            db.session.rollback()
+            return jsonify(error="Content hash mismatch", version=version), 409
+
+    try:
+        db.session.commit()
+    except StaleDataError:
+        return version_conflict(nid)
+    return jsonify(message="ok", version=n.version, updated_at=n.updated_at.isoformat())
+
+
+@bp.post("/batch")
+@login_required
+def batch_notes():
+    # 多选操作：整批一个事务，按操作做集合式 SQL，归属校验整批只查一次
+    data = request.get_json() or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify(error="Missing operations"), 400
+
+    all_ids: set[int] = set()
+    all_tag_ids: set[int] = set()
+    for op in operations:
+        if not isinstance(op, dict) or op.get("op") not in BATCH_OPS:
+            return jsonify(error="Invalid operation"), 400
+        ids = op.get("ids")
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify(error="Invalid ids"), 400
+        all_ids.update(ids)
+        if op["op"] in {"add_tag", "remove_tag"}:
+            if not isinstance(op.get("tag_id"), int):
+                return jsonify(error="Missing tag_id"), 400
+            all_tag_ids.add(op["tag_id"])
+        if op["op"] == "set_tags":
+            tag_ids = op.get("tag_ids")
+            if not isinstance(tag_ids, list) or not all(isinstance(t, int) for t in tag_ids):
+                return jsonify(error="Invalid tag_ids"), 400
+            all_tag_ids.update(tag_ids)
+    if len(all_ids) > BATCH_LIMIT:
+        return jsonify(error=f"Too many notes (max {BATCH_LIMIT})"), 413
+
+    owned = set(
+        db.session.scalars(
+            select(Note.id).where(Note.user_id == current_user.id, Note.id.in_(all_ids))
+        )
+    )
+    owned_tags = set(
+        db.session.scalars(
+            select(Tag.id).where(Tag.user_id == current_user.id, Tag.id.in_(all_tag_ids))
+        )
+    )
 
+    results = []
+    for op in operations:
+        kind = op["op"]
+        targets = [i for i in dict.fromkeys(op["ids"]) if i in owned]
+        items = [{"id": i, "status": "ok" if i in owned else "not_found"} for i in op["ids"]]
+
+        tag_ids = [op["tag_id"]] if kind in {"add_tag", "remove_tag"} else op.get("tag_ids", [])
+        missing_tags = [t for t in dict.fromkeys(tag_ids) if t not in owned_tags]
+        if missing_tags:
+            # 整个操作不执行：每条笔记都标明未处理，并给出找不到的标签
+            skipped = [{"id": i, "status": "skipped" if i in owned else "not_found"} for i in op["ids"]]
+            results.append({"op": kind, "error": "Tag not found", "tag_ids": missing_tags, "items": skipped})
+            continue
+
+        if targets:
+            apply_batch_operation(kind, targets, tag_ids)
+        if kind == "delete":
+            owned.difference_update(targets)
+        results.append({"op": kind, "items": items})
+
+    # 置顶不影响标签列表，其他操作都会改变标签的笔记数
+    if any(op["op"] not in {"pin", "unpin"} for op in operations):
+        cache.invalidate(note_tags_tag(current_user.id))
     db.session.commit()
-    return jsonify(
-        {
-            "message": "ok",
-            "note": {
-                "id": n.id,
-                "title": n.title,
-                "content": n.content,
-                "is_pinned": n.is_pinned,
-                "created_at": n.created_at.isoformat(),
-                "updated_at": n.updated_at.isoformat(),
-                "tags": [{"id": t.id, "name": t.name, "color": t.color} for t in n.tags],
-            },
-        }
-    )
+    return jsonify(message="ok", results=results)
+
+
+def apply_batch_operation(kind: str, ids: list[int], tag_ids: list[int]) -> None:
+    if kind == "delete":
+        created = db.session.scalars(select(Note.created_at).where(Note.id.in_(ids))).all()
+        stats.notes_deleted(current_user.id, list(created))
+        db.session.execute(delete(note_tags).where(note_tags.c.note_id.in_(ids)))
+        remove_from_index(db.session.connection(), ids)
+        db.session.execute(delete(Note).where(Note.id.in_(ids)))
+    elif kind in {"pin", "unpin"}:
+        db.session.execute(
+            update(Note)
+            .where(Note.id.in_(ids))
+            .values(is_pinned=kind == "pin", version=Note.version + 1)
+        )
+    elif kind == "remove_tag":
+        linked = db.session.scalars(
+            select(note_tags.c.note_id).where(note_tags.c.tag_id == tag_ids[0], note_tags.c.note_id.in_(ids))
+        ).all()
+        if linked:
+            db.session.execute(
+                delete(note_tags).where(note_tags.c.tag_id == tag_ids[0], note_tags.c.note_id.in_(linked))
+            )
+            bump_versions(linked)
+    else:
+        if kind == "set_tags":
+            db.session.execute(delete(note_tags).where(note_tags.c.note_id.in_(ids)))
+            existing = set()
+            # 整体替换标签，结果可能与原来相同，但不再逐条比较，一律视为修改
+            bump_versions(ids)
+        else:
+            existing = set(
+                db.session.execute(
+                    select(note_tags.c.note_id, note_tags.c.tag_id).where(
+                        note_tags.c.tag_id.in_(tag_ids), note_tags.c.note_id.in_(ids)
+                    )
+                ).tuples()
+            )
+        rows = [
+            {"note_id": nid, "tag_id": tid}
+            for nid in ids
+            for tid in dict.fromkeys(tag_ids)
+            if (nid, tid) not in existing
+        ]
+        if rows:
+            db.session.execute(insert(note_tags), rows)
+            if kind == "add_tag":
+                bump_versions(list(dict.fromkeys(row["note_id"] for row in rows)))
+
+
+def bump_versions(ids: list[int]) -> None:
+    # 标签改动也要让笔记版本号前进，持有旧版本的 PATCH 客户端才会收到 409 并重新加载
+    db.session.execute(update(Note).where(Note.id.in_(ids)).values(version=Note.version + 1))
 
 
 @bp.post("/<int:nid>/toggle-pin")
 @login_required
 def toggle_pin_note(nid: int):
-    n = Note.query.filter_by(id=nid, user_id=current_user.id).first_or_404()
-    n.is_pinned = not n.is_pinned
-    db.session.commit()
+    def apply(n: Note) -> None:
+        n.is_pinned = not n.is_pinned
+
+    n = commit_note_change(nid, apply)
+    if n is None:
+        return version_conflict(nid)
     return jsonify({"message": "ok", "is_pinned": n.is_pinned})
 
 
 @bp.delete("/<int:nid>")
 @login_required
 def delete_note(nid: int):
-    n = Note.query.filter_by(id=nid, user_id=current_user.id).first_or_404()
-    db.session.delete(n)
-    db.session.commit()
+    def apply(n: Note) -> None:
+        stats.notes_deleted(current_user.id, [n.created_at])
+        cache.invalidate(note_tags_tag(current_user.id))
+        db.session.delete(n)
+
+    if commit_note_change(nid, apply) is None:
+        return version_conflict(nid)
     return jsonify(message="ok")
 
 
 @bp.get("/tags")
 @login_required
+@cached_view("note-tags", tags=lambda: [note_tags_tag(current_user.id)])
 def list_tags():
     tags = Tag.query.filter_by(user_id=current_user.id).order_by(Tag.name).all()
     return jsonify(
@@ -145,6 +516,7 @@ def create_tag():
 
     tag = Tag(name=name, color=color, user_id=current_user.id)
     db.session.add(tag)
+    cache.invalidate(note_tags_tag(current_user.id))
     db.session.commit()
     return jsonify({"id": tag.id, "name": tag.name, "color": tag.color, "note_count": 0}), 201
 
@@ -165,6 +537,7 @@ def update_tag(tag_id: int):
     if "color" in data:
         tag.color = data.get("color", tag.color)
 
+    cache.invalidate(note_tags_tag(current_user.id))
     db.session.commit()
     return jsonify(
         {"id": tag.id, "name": tag.name, "color": tag.color, "note_count": len(tag.notes)}
@@ -176,6 +549,7 @@ def update_tag(tag_id: int):
 def delete_tag(tag_id: int):
     tag = Tag.query.filter_by(id=tag_id, user_id=current_user.id).first_or_404()
     db.session.delete(tag)
+    cache.invalidate(note_tags_tag(current_user.id))
     db.session.commit()
     return jsonify(message="ok")
 
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 
+import stats
 from extensions import db
 from models import PasswordResetRequest
 
@@ -15,5 +16,6 @@ def create_password_reset_request():
 
     req = PasswordResetRequest(email=email, status="pending")
     db.session.add(req)
+    stats.reset_requested()
     db.session.commit()
     return jsonify(message="ok")
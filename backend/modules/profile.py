@@ -1,14 +1,27 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, abort, jsonify, request, send_file
 from flask_login import current_user, login_required
 
+from avatars import (
+    MAX_AVATAR_BYTES,
+    AvatarError,
+    avatar_url,
+    decode_data_url,
+    store_avatar,
+    thumbnail_for,
+)
+from cache import cache, cached_view, user_tag
 from extensions import db
-from models import User
+from models import User, invalidate_user_cache
 
 bp = Blueprint("profile", __name__, url_prefix="/api/profile")
 
+# 多读 1 字节，超限的上传交给 store_avatar 统一报错
+MAX_UPLOAD_READ = MAX_AVATAR_BYTES + 1
+
 
 @bp.get("/")
 @login_required
+@cached_view("profile", tags=lambda: [user_tag(current_user.id)])
 def get_profile():
     return jsonify(
         profile={
@@ -26,14 +39,52 @@ def get_profile():
 @login_required
 def update_profile():
     data = request.get_json() or {}
+    new_avatar = data.get("avatar_url")
+    if new_avatar is not None and not isinstance(new_avatar, str):
+        return jsonify(error="Invalid avatar_url"), 400
     current_user.display_name = (data.get("display_name") or "").strip()
     current_user.phone = (data.get("phone") or "").strip()
     current_user.bio = (data.get("bio") or "").strip()
-    avatar_url = data.get("avatar_url")
-    if avatar_url is not None:
-        current_user.avatar_url = avatar_url
+    if new_avatar is not None:
+        if new_avatar.startswith("data:"):
+            # 兼容旧前端：data URL 也落到头像存储里，不再整段写进 user 表
+            try:
+                new_avatar = avatar_url(store_avatar(decode_data_url(new_avatar)))
+            except AvatarError as exc:
+                return jsonify(error=str(exc)), 400
+        current_user.avatar_url = new_avatar
+    invalidate_user_cache(current_user.id)
     db.session.commit()
-    return jsonify(message="ok")
+    return jsonify(message="ok", avatar_url=current_user.avatar_url)
+
+
+@bp.post("/avatar")
+@login_required
+def upload_avatar():
+    upload = request.files.get("avatar")
+    if upload is None:
+        return jsonify(error="Missing avatar"), 400
+    try:
+        digest = store_avatar(upload.read(MAX_UPLOAD_READ))
+    except AvatarError as exc:
+        return jsonify(error=str(exc)), 400
+    current_user.avatar_url = avatar_url(digest)
+    cache.invalidate(user_tag(current_user.id))
+    db.session.commit()
+    return jsonify(message="ok", avatar_url=current_user.avatar_url)
+
+
+@bp.get("/avatars/<digest>")
+def get_avatar(digest: str):
+    size = request.args.get("size", type=int)
+    path = thumbnail_for(digest, size)
+    if path is None:
+        abort(404)
+    # 文件名就是内容哈希，可以放心长期缓存
+    response = send_file(path, mimetype="image/png", etag=path.stem, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 @bp.put("/password")
@@ -47,6 +98,7 @@ def update_password():
     if not current_user.check_password(current_password):
         return jsonify(error="Invalid current password"), 403
     current_user.set_password(new_password)
+    invalidate_user_cache(current_user.id)
     db.session.commit()
     return jsonify(message="ok")
 
@@ -64,5 +116,6 @@ def update_email():
     if new_email != current_user.email and User.query.filter_by(email=new_email).first():
         return jsonify(error="Email already exists"), 409
     current_user.email = new_email
+    invalidate_user_cache(current_user.id)
     db.session.commit()
     return jsonify(message="ok", email=current_user.email)
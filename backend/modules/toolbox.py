@@ -1,11 +1,14 @@
 from flask import Blueprint, jsonify
 from flask_login import login_required
 
+from cache import cached_view
+
 bp = Blueprint("toolbox", __name__, url_prefix="/api/tools")
 
 
 @bp.get("/")
 @login_required
+@cached_view("tools", per_user=False)
 def list_tools():
     # 工具箱注册表：后端声明，前端动态渲染
     tools = [
@@ -0,0 +1,451 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Iterator
+
+from sqlalchemy import insert, select, update
+
+import stats
+from cache import cache, note_tags_tag
+from extensions import db
+from models import ImportJob, Note, Tag, note_tags
+from search import index_notes
+from textutil import content_hash, make_excerpt
+
+# 导出按 id 分块取数，每块一次查询，内存占用与笔记总数无关
+EXPORT_CHUNK_SIZE = 500
+
+SLUG_RE = re.compile(r"[^\w\-]+", re.UNICODE)
+
+
+def export_tags(user_id: int) -> list[dict]:
+    rows = db.session.execute(
+        select(Tag.id, Tag.name, Tag.color).where(Tag.user_id == user_id).order_by(Tag.id)
+    )
+    return [{"id": r.id, "name": r.name, "color": r.color} for r in rows]
+
+
+def iter_note_chunks(
+    user_id: int, after_id: int = 0, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[list[dict]]:
+    """按 id 升序分块产出笔记（含标签名），after_id 用于断点续传。
+
+    用 id 做键集分页而不是一个长期打开的服务端游标：每块之间还要查标签，
+    MySQL 的流式游标未读完时同一连接不能再发查询。
+    """
+    last_id = after_id
+    while True:
+        rows = db.session.execute(
+            select(
+                Note.id,
+                Note.title,
+                Note.content,
+                Note.is_pinned,
+                Note.created_at,
+                Note.updated_at,
+            )
+            .where(Note.user_id == user_id, Note.id > last_id)
+            .order_by(Note.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        ids = [r.id for r in rows]
+        tag_names: dict[int, list[str]] = {}
+        for note_id, name in db.session.execute(
+            select(note_tags.c.note_id, Tag.name)
+            .join(Tag, Tag.id == note_tags.c.tag_id)
+            .where(note_tags.c.note_id.in_(ids))
+            .order_by(note_tags.c.note_id, Tag.name)
+        ):
+            tag_names.setdefault(note_id, []).append(name)
+        yield [
+            {
+                "id": r.id,
+                "title": r.title or "",
+                "content": r.content or "",
+                "is_pinned": bool(r.is_pinned),
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+                "updated_at": r.updated_at.isoformat() if r.updated_at else None,
+                "tags": tag_names.get(r.id, []),
+            }
+            for r in rows
+        ]
+        last_id = ids[-1]
+
+
+def export_ndjson(user_id: int, after_id: int = 0) -> Iterator[str]:
+    # 先输出全部标签，再逐条输出笔记，最后一行是结束标记；客户端据最后收到的笔记 id 续传
+    for tag in export_tags(user_id):
+        yield json.dumps({"type": "tag", **tag}, ensure_ascii=False) + "\n"
+    count, last_id = 0, after_id
+    for chunk in iter_note_chunks(user_id, after_id):
+        lines = [json.dumps({"type": "note", **note}, ensure_ascii=False) for note in chunk]
+        count += len(chunk)
+        last_id = chunk[-1]["id"]
+        yield "\n".join(lines) + "\n"
+    yield json.dumps({"type": "end", "count": count, "last_id": last_id}) + "\n"
+
+
+def render_markdown(note: dict) -> str:
+    # front matter 的值用 JSON 书写（JSON 也是合法的 YAML），导入时按 JSON 解析
+    meta = {key: note[key] for key in ("id", "title", "tags", "is_pinned", "created_at", "updated_at")}
+    lines = ["---"] + [f"{key}: {json.dumps(value, ensure_ascii=False)}" for key, value in meta.items()]
+    return "\n".join(lines) + "\n---\n\n" + note["content"] + "\n"
+
+
+def markdown_filename(note: dict) -> str:
+    slug = SLUG_RE.sub("-", note["title"]).strip("-")[:60] or "untitled"
+    return f"notes/{note['id']:08d}-{slug}.md"
+
+
+class _ChunkSink:
+    """只写不 seek 的文件对象：zipfile 写进来的字节攒着，由生成器取走。"""
+
+    def __init__(self):
+        self.parts: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def export_zip(user_id: int, after_id: int = 0) -> Iterator[bytes]:
+    # 不可 seek 的输出流上 zipfile 会用数据描述符，整个包边生成边发送
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("tags.json", json.dumps(export_tags(user_id), ensure_ascii=False, indent=2))
+        for chunk in iter_note_chunks(user_id, after_id):
+            for note in chunk:
+                archive.writestr(markdown_filename(note), render_markdown(note))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ---- 导入 ----
+
+DEFAULT_TAG_COLOR = "#007bff"
+FRONT_MATTER_RE = re.compile(r"\A---\r?\n(?P<meta>.*?)\r?\n---\r?\n?", re.DOTALL)
+TITLE_LENGTH = Note.__table__.c.title.type.length
+TAG_NAME_LENGTH = Tag.__table__.c.name.type.length
+
+
+# zip 导入按解压后的大小限制：单个文件和全部文件合计
+ZIP_MAX_MEMBER_BYTES = 10 * 1024 * 1024
+ZIP_MAX_TOTAL_BYTES = 1024 * 1024 * 1024
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def parse_front_matter(text: str) -> tuple[dict, str]:
+    # 与 render_markdown 对应：每行 "key: <JSON 值>"；不是 JSON 的值按原样字符串处理
+    m = FRONT_MATTER_RE.match(text)
+    if not m:
+        return {}, text
+    meta = {}
+    for line in m["meta"].splitlines():
+        key, sep, raw = line.partition(":")
+        if not sep:
+            continue
+        raw = raw.strip()
+        try:
+            meta[key.strip()] = json.loads(raw)
+        except ValueError:
+            meta[key.strip()] = raw
+    return meta, text[m.end():].lstrip("\n")
+
+
+def _parse_time(value) -> datetime | None:
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        # 库里和统计都是本地时间的 naive datetime，带时区（含 Z）的先换成本地时间
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def normalize_record(data: dict) -> dict | None:
+    """把一条外部记录整理成插入用的字段；不合法返回 None。"""
+    title, content = data.get("title", ""), data.get("content", "")
+    tags = data.get("tags", [])
+    if not isinstance(title, str) or not isinstance(content, str) or not isinstance(tags, list):
+        return None
+    names = []
+    for tag in tags:
+        name = tag.get("name") if isinstance(tag, dict) else tag
+        if isinstance(name, str) and name.strip():
+            names.append(name.strip()[:TAG_NAME_LENGTH])
+    now = datetime.now()
+    created_at = _parse_time(data.get("created_at")) or now
+    return {
+        "title": title[:TITLE_LENGTH],
+        "content": content,
+        "is_pinned": bool(data.get("is_pinned", False)),
+        "created_at": created_at,
+        "updated_at": _parse_time(data.get("updated_at")) or created_at,
+        "tags": list(dict.fromkeys(names)),
+    }
+
+
+def read_ndjson(path: str, tag_colors: dict) -> Iterator[dict | None]:
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield None
+                continue
+            if not isinstance(data, dict):
+                yield None
+                continue
+            kind = data.get("type", "note")
+            if kind == "tag":
+                if isinstance(data.get("name"), str) and isinstance(data.get("color"), str):
+                    tag_colors[data["name"].strip()] = data["color"][:7]
+            elif kind == "note":
+                yield normalize_record(data)
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int) -> bytes | None:
+    # 解压流最多读 max_bytes + 1 字节，不信任头里声明的大小；超限或数据损坏返回 None
+    try:
+        with archive.open(info) as member:
+            data = member.read(max_bytes + 1)
+    except (zipfile.BadZipFile, NotImplementedError, OSError, EOFError):
+        return None
+    return data if len(data) <= max_bytes else None
+
+
+def read_zip(
+    path: str,
+    tag_colors: dict,
+    max_member_bytes: int = ZIP_MAX_MEMBER_BYTES,
+    max_total_bytes: int = ZIP_MAX_TOTAL_BYTES,
+) -> Iterator[dict | None]:
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as exc:
+        raise ImportFormatError("Invalid zip file") from exc
+    with archive:
+        members = [
+            info
+            for info in archive.infolist()
+            if info.filename == "tags.json" or info.filename.lower().endswith(".md")
+        ]
+        # 读之前先按目录里声明的解压后大小挡掉压缩炸弹；单个超限的文件计入 skipped
+        if sum(info.file_size for info in members) > max_total_bytes:
+            raise ImportFormatError("Zip file too large when extracted")
+        by_name = {info.filename: info for info in members if info.file_size <= max_member_bytes}
+        if "tags.json" in by_name:
+            try:
+                for tag in json.loads(_read_member(archive, by_name.pop("tags.json"), max_member_bytes) or b""):
+                    tag_colors[str(tag["name"]).strip()] = str(tag.get("color") or DEFAULT_TAG_COLOR)[:7]
+            except (ValueError, TypeError, KeyError):
+                pass
+        for info in sorted(members, key=lambda info: info.filename):
+            name = info.filename
+            if name == "tags.json":
+                continue
+            data = _read_member(archive, info, max_member_bytes) if name in by_name else None
+            if data is None:
+                yield None
+                continue
+            meta, body = parse_front_matter(data.decode("utf-8", errors="replace"))
+            if "title" not in meta:
+                meta["title"] = os.path.splitext(os.path.basename(name))[0]
+            yield normalize_record({**meta, "content": body})
+
+
+def _resolve_tags(user_id: int, names: set[str], tag_ids: dict, tag_colors: dict) -> None:
+    # 已知的跳过，其余先查库，库里也没有的一次性批量插入
+    names = names - tag_ids.keys()
+    if not names:
+        return
+    lookup = select(Tag.name, Tag.id).where(Tag.user_id == user_id, Tag.name.in_(names))
+    tag_ids.update(db.session.execute(lookup).tuples().all())
+    missing = names - tag_ids.keys()
+    if missing:
+        db.session.execute(
+            insert(Tag.__table__),
+            [
+                {"name": name, "color": tag_colors.get(name, DEFAULT_TAG_COLOR), "user_id": user_id}
+                for name in sorted(missing)
+            ],
+        )
+        tag_ids.update(db.session.execute(lookup).tuples().all())
+
+
+def _insert_notes(rows: list[dict]) -> list[int]:
+    table = Note.__table__
+    if db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        # 一条 executemany 拿回与输入同序的主键（SQLite / PostgreSQL）
+        stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        return list(db.session.execute(stmt, rows).scalars())
+    # MySQL 不支持 RETURNING：仍在同一事务里逐行插入
+    return [db.session.execute(insert(table).values(**row)).inserted_primary_key[0] for row in rows]
+
+
+def import_batch(user_id: int, records: list[dict], tag_ids: dict, tag_colors: dict) -> None:
+    _resolve_tags(user_id, {name for r in records for name in r["tags"]}, tag_ids, tag_colors)
+    # Core 插入不走 @validates，摘要/长度/哈希在这里算
+    rows = [
+        {
+            "user_id": user_id,
+            "title": r["title"],
+            "content": r["content"],
+            "excerpt": make_excerpt(r["content"]),
+            "content_length": len(r["content"]),
+            "content_hash": content_hash(r["content"]),
+            "is_pinned": r["is_pinned"],
+            "version": 1,
+            "created_at": r["created_at"],
+            "updated_at": r["updated_at"],
+        }
+        for r in records
+    ]
+    ids = _insert_notes(rows)
+    stats.notes_created(user_id, [r["created_at"] for r in records])
+    links = [{"note_id": nid, "tag_id": tag_ids[name]} for nid, r in zip(ids, records) for name in r["tags"]]
+    if links:
+        db.session.execute(insert(note_tags), links)
+        cache.invalidate(note_tags_tag(user_id))
+    index_notes(
+        db.session.connection(),
+        [
+            SimpleNamespace(id=nid, user_id=user_id, title=r["title"], content=r["content"])
+            for nid, r in zip(ids, records)
+        ],
+    )
+
+
+def _set_job(job_id: str, **values) -> None:
+    db.session.execute(
+        update(ImportJob).where(ImportJob.id == job_id).values(updated_at=datetime.now(), **values)
+    )
+
+
+def run_import(
+    job_id: str,
+    user_id: int,
+    fmt: str,
+    path: str,
+    batch_size: int,
+    zip_max_member_bytes: int = ZIP_MAX_MEMBER_BYTES,
+    zip_max_total_bytes: int = ZIP_MAX_TOTAL_BYTES,
+) -> None:
+    """在后台线程里执行：每批一个事务，进度随批次一起提交。"""
+    tag_ids: dict[str, int] = {}
+    tag_colors: dict[str, str] = {}
+    processed = imported = skipped = 0
+    try:
+        _set_job(job_id, status="running")
+        db.session.commit()
+        if fmt == "ndjson":
+            records = read_ndjson(path, tag_colors)
+        else:
+            records = read_zip(path, tag_colors, zip_max_member_bytes, zip_max_total_bytes)
+        batch: list[dict] = []
+        for record in records:
+            processed += 1
+            if record is None:
+                skipped += 1
+            else:
+                batch.append(record)
+            if len(batch) >= batch_size:
+                import_batch(user_id, batch, tag_ids, tag_colors)
+                imported += len(batch)
+                batch = []
+                _set_job(job_id, processed=processed, imported=imported, skipped=skipped)
+                db.session.commit()
+        if batch:
+            import_batch(user_id, batch, tag_ids, tag_colors)
+            imported += len(batch)
+        _set_job(job_id, status="done", processed=processed, imported=imported, skipped=skipped)
+        db.session.commit()
+    except Exception as exc:  # noqa: BLE001 — 任务失败要落库，已提交的批次保留
+        db.session.rollback()
+        _set_job(job_id, status="failed", error=str(exc)[:500])
+        db.session.commit()
+        if not isinstance(exc, ImportFormatError):
+            raise
+    finally:
+        db.session.remove()
+        os.unlink(path)
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _forget_executor() -> None:
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_executor)
+
+
+def start_import(app, user_id: int, fmt: str, path: str) -> str:
+    global _executor
+    job_id = uuid.uuid4().hex
+    db.session.add(ImportJob(id=job_id, user_id=user_id, format=fmt))
+    db.session.commit()
+
+    def task():
+        with app.app_context():
+            try:
+                run_import(
+                    job_id,
+                    user_id,
+                    fmt,
+                    path,
+                    app.config["NOTES_IMPORT_BATCH_SIZE"],
+                    app.config["NOTES_IMPORT_ZIP_MAX_MEMBER_BYTES"],
+                    app.config["NOTES_IMPORT_ZIP_MAX_TOTAL_BYTES"],
+                )
+            except Exception:  # noqa: BLE001
+                app.logger.exception("Import job %s failed", job_id)
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config["NOTES_IMPORT_WORKERS"], thread_name_prefix="notes-import"
+            )
+        _executor.submit(task)
+    return job_id
+
+
+def fail_interrupted_imports() -> int:
+    # 进程重启时还在 pending/running 的任务已经没有线程在跑了
+    result = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.status.in_(("pending", "running")))
+        .values(status="failed", error="Interrupted by restart", updated_at=datetime.now())
+    )
+    db.session.commit()
+    return result.rowcount
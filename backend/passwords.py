@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# 各算法的默认成本：pbkdf2 为迭代次数，scrypt 为 N，bcrypt 为 rounds（log2）
+DEFAULT_COSTS = {"pbkdf2": 600000, "scrypt": 32768, "bcrypt": 12}
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def method_spec(method: str, cost: int) -> str:
+    if method == "pbkdf2":
+        return f"pbkdf2:sha256:{cost}"
+    if method == "scrypt":
+        return f"scrypt:{cost}:8:1"
+    if method == "bcrypt":
+        return f"bcrypt:{cost}"
+    raise ValueError(f"Unknown password hash method: {method}")
+
+
+def _hash(spec: str, pwd: str) -> str:
+    if spec.startswith("bcrypt:"):
+        rounds = int(spec.split(":", 1)[1])
+        return bcrypt.hashpw(pwd.encode(), bcrypt.gensalt(rounds)).decode()
+    return generate_password_hash(pwd, method=spec)
+
+
+def _verify(stored: str, pwd: str) -> bool:
+    if stored.startswith("$2"):
+        try:
+            return bcrypt.checkpw(pwd.encode(), stored.encode())
+        except ValueError:
+            return False
+    return check_password_hash(stored, pwd)
+
+
+class PasswordHasher:
+    """把哈希/校验放进有界进程池，避免 CPU 密集的计算占住请求线程。
+
+    排队（含正在计算）的任务超过 max_pending 时直接抛 PasswordHasherBusy，
+    而不是让请求无限等下去。workers <= 0 时在当前线程内计算。
+    """
+
+    def __init__(self):
+        self.method = "scrypt"
+        self.cost = DEFAULT_COSTS["scrypt"]
+        self.spec = method_spec(self.method, self.cost)
+        self.workers = 0
+        self.max_pending = 1
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots = threading.BoundedSemaphore(1)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def configure(self, method: str, cost: int | None, workers: int, max_pending: int) -> None:
+        spec = method_spec(method, cost or DEFAULT_COSTS[method])
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            self.method = method
+            self.cost = cost or DEFAULT_COSTS[method]
+            self.spec = spec
+            self.workers = workers
+            self.max_pending = max(1, max_pending)
+            self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def shutdown(self) -> None:
+        # 在要 fork 的父进程里调用（gunicorn preload）：进程池和它的管理线程不该带进 fork，
+        # 父进程里也不再需要；之后真要用时 _get_pool 会重新创建
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def forget_pool(self) -> None:
+        # fork 出来的子进程不能复用父进程的进程池
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            # 多个请求线程同时被拒，+= 不是原子操作
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+        try:
+            return self._get_pool().submit(func, *args).result()
+        finally:
+            slots.release()
+
+    def hash(self, pwd: str) -> str:
+        return self._run(_hash, self.spec, pwd)
+
+    def verify(self, stored: str, pwd: str) -> bool:
+        if not stored or not isinstance(pwd, str):
+            return False
+        return self._run(_verify, stored, pwd)
+
+    def needs_rehash(self, stored: str) -> bool:
+        # 存储的算法或成本与当前配置不一致
+        if stored.startswith("$2"):
+            parts = stored.split("$")
+            return self.method != "bcrypt" or len(parts) < 3 or parts[2] != f"{self.cost:02d}"
+        return stored.split("$", 1)[0] != self.spec
+
+
+password_hasher = PasswordHasher()
+os.register_at_fork(after_in_child=password_hasher.forget_pool)
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import html
+import re
+
+from flask import current_app, has_app_context
+from sqlalchemy import column, event, func, inspect, literal_column, or_, select, table, text
+from sqlalchemy.dialects.mysql import match as mysql_match
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models import Note
+from textutil import strip_html
+
+# 全文检索后端：sqlite 下用 FTS5 虚拟表，mysql 下用 ngram FULLTEXT 索引，其余退回 LIKE
+FTS_TABLE = "note_fts"
+MYSQL_INDEX = "ft_note_search"
+
+note_fts = table(FTS_TABLE, column("rowid"), column("user_id"), column("title"), column("body"))
+
+# 中日韩文字没有空格分词，按二元组（bigram）切分后再交给 unicode61 分词器
+CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+")
+
+
+def _fts_table_exists(connection) -> bool:
+    return (
+        connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+        is not None
+    )
+
+
+def _mysql_index_exists(connection) -> bool:
+    return (
+        connection.execute(
+            text("SHOW INDEX FROM note WHERE Key_name = :name"), {"name": MYSQL_INDEX}
+        ).first()
+        is not None
+    )
+
+
+def resolve_search_backend(app) -> str:
+    """按配置、数据库类型和索引是否已建好决定实际使用的后端，不建任何东西。
+
+    与 init_db 无关：跳过初始化启动的进程也能识别已有的 FTS 表，写入时照常同步索引。
+    """
+    backend = app.config.get("NOTE_SEARCH_BACKEND") or "auto"
+    dialect = db.engine.dialect.name
+    if backend == "auto":
+        backend = {"sqlite": "fts5", "mysql": "mysql"}.get(dialect, "like")
+    if backend in {"fts5", "mysql"}:
+        try:
+            with db.engine.connect() as connection:
+                exists = _fts_table_exists(connection) if backend == "fts5" else _mysql_index_exists(connection)
+        except SQLAlchemyError:
+            # 库还连不上或还没建表：这次按 LIKE 处理，下次用到时再判断
+            return "like"
+        if not exists:
+            # 索引由 ensure_search_index() 建立，建好前先用 LIKE
+            backend = "like"
+    app.extensions["note_search"] = backend
+    return backend
+
+
+def search_backend() -> str:
+    if not has_app_context():
+        return "like"
+    backend = current_app.extensions.get("note_search")
+    if backend is None:
+        backend = resolve_search_backend(current_app)
+    return backend
+
+
+def _cjk_ngrams(run: str, trailing: bool) -> list[str]:
+    if len(run) == 1:
+        return [run]
+    grams = [run[i : i + 2] for i in range(len(run) - 1)]
+    if trailing:
+        # 末尾单字也入索引，这样单字查询可以用前缀匹配覆盖每一个字
+        grams.append(run[-1])
+    return grams
+
+
+def index_text(value: str | None) -> str:
+    plain = strip_html(value)
+    return CJK_RUN.sub(lambda m: " " + " ".join(_cjk_ngrams(m.group(0), True)) + " ", plain)
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _query_terms(search: str) -> list[tuple[str, bool]]:
+    # 返回 (词, 是否为中日韩片段)，每个片段在查询中独立 AND
+    terms: list[tuple[str, bool]] = []
+    for word in search.split():
+        pos = 0
+        for m in CJK_RUN.finditer(word):
+            if m.start() > pos:
+                terms.append((word[pos : m.start()], False))
+            terms.append((m.group(0), True))
+            pos = m.end()
+        if pos < len(word):
+            terms.append((word[pos:], False))
+    return [(t, cjk) for t, cjk in terms if t.strip(" \"'*")]
+
+
+def fts_query(search: str) -> str:
+    parts = []
+    for term, cjk in _query_terms(search):
+        if not cjk:
+            parts.append(_quote(term) + "*")
+        elif len(term) == 1:
+            parts.append(_quote(term) + "*")
+        else:
+            parts.append(_quote(" ".join(_cjk_ngrams(term, False))))
+    return " AND ".join(parts)
+
+
+def mysql_query(search: str) -> str:
+    return " ".join("+" + _quote(term) for term, _ in _query_terms(search))
+
+
+def apply_search(query, search: str):
+    """给 Note 查询加上全文检索条件，返回 (query, 排序表达式)。"""
+    backend = search_backend()
+    if backend == "fts5":
+        match = fts_query(search)
+        if match:
+            rank = func.bm25(literal_column(FTS_TABLE), 0.0, 10.0, 1.0)
+            query = query.join(note_fts, note_fts.c.rowid == Note.id).filter(
+                literal_column(FTS_TABLE).op("MATCH")(match)
+            )
+            return query, rank.asc()
+    elif backend == "mysql":
+        against = mysql_query(search)
+        if against:
+            score = mysql_match(Note.title, Note.content, against=against).in_boolean_mode()
+            return query.filter(score > 0), score.desc()
+
+    return (
+        query.filter(or_(Note.title.contains(search), Note.content.contains(search))),
+        None,
+    )
+
+
+def make_snippet(value: str | None, search: str, width: int = 80) -> str:
+    plain = strip_html(value)
+    words = [w for w in search.split() if w]
+    if not plain or not words:
+        return html.escape(plain[:width])
+
+    pattern = re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+    first = pattern.search(plain)
+    start = max(0, first.start() - width // 3) if first else 0
+    end = min(len(plain), start + width)
+    excerpt = plain[start:end]
+
+    pieces = []
+    pos = 0
+    for m in pattern.finditer(excerpt):
+        pieces.append(html.escape(excerpt[pos : m.start()]))
+        pieces.append("<mark>" + html.escape(m.group(0)) + "</mark>")
+        pos = m.end()
+    pieces.append(html.escape(excerpt[pos:]))
+    return ("…" if start > 0 else "") + "".join(pieces) + ("…" if end < len(plain) else "")
+
+
+def _index_rows(connection, notes) -> None:
+    connection.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, user_id, title, body) VALUES (:id, :uid, :title, :body)"),
+        [
+            {
+                "id": n.id,
+                "uid": n.user_id,
+                "title": index_text(n.title),
+                "body": index_text(n.content),
+            }
+            for n in notes
+        ],
+    )
+
+
+def index_notes(connection, notes) -> None:
+    # 批量导入走 Core 插入，不触发下面的 mapper 事件，需要显式建索引
+    if search_backend() == "fts5" and notes:
+        _index_rows(connection, notes)
+
+
+def remove_from_index(connection, note_ids) -> None:
+    if search_backend() != "fts5" or not note_ids:
+        return
+    connection.execute(
+        text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), [{"id": nid} for nid in note_ids]
+    )
+
+
+@event.listens_for(Note, "after_insert")
+def _note_inserted(mapper, connection, target) -> None:
+    if search_backend() == "fts5":
+        _index_rows(connection, [target])
+
+
+@event.listens_for(Note, "after_update")
+def _note_updated(mapper, connection, target) -> None:
+    if search_backend() != "fts5":
+        return
+    state = inspect(target)
+    if not (state.attrs.title.history.has_changes() or state.attrs.content.history.has_changes()):
+        return
+    remove_from_index(connection, [target.id])
+    _index_rows(connection, [target])
+
+
+@event.listens_for(Note, "after_delete")
+def _note_deleted(mapper, connection, target) -> None:
+    remove_from_index(connection, [target.id])
+
+
+def rebuild_search_index(batch_size: int = 500) -> int:
+    count = 0
+    last_id = 0
+    with db.engine.begin() as connection:
+        connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        while True:
+            rows = connection.execute(
+                select(Note.id, Note.user_id, Note.title, Note.content)
+                .where(Note.id > last_id)
+                .order_by(Note.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            _index_rows(connection, rows)
+            count += len(rows)
+            last_id = rows[-1].id
+    return count
+
+
+def _index_out_of_sync() -> bool:
+    # 之前有进程写入时没同步索引的话，条目数会对不上，启动时整体重建
+    with db.engine.connect() as connection:
+        indexed = connection.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+        notes = connection.execute(select(func.count(Note.id))).scalar()
+    return indexed != notes
+
+
+def ensure_search_index(app) -> str:
+    """建立全文索引（幂等），并记下实际使用的后端。"""
+    backend = app.config.get("NOTE_SEARCH_BACKEND") or "auto"
+    dialect = db.engine.dialect.name
+    if backend == "auto":
+        backend = {"sqlite": "fts5", "mysql": "mysql"}.get(dialect, "like")
+
+    if backend == "fts5":
+        try:
+            with db.engine.begin() as connection:
+                exists = _fts_table_exists(connection)
+                if not exists:
+                    connection.execute(
+                        text(
+                            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                            "user_id UNINDEXED, title, body, tokenize = 'unicode61')"
+                        )
+                    )
+        except Exception:
+            app.logger.warning("SQLite FTS5 unavailable, falling back to LIKE search")
+            backend = "like"
+        else:
+            if not exists or _index_out_of_sync():
+                rebuild_search_index()
+    elif backend == "mysql":
+        with db.engine.begin() as connection:
+            if not _mysql_index_exists(connection):
+                connection.execute(
+                    text(
+                        f"ALTER TABLE note ADD FULLTEXT INDEX {MYSQL_INDEX} (title, content) "
+                        "WITH PARSER ngram"
+                    )
+                )
+
+    app.extensions["note_search"] = backend
+    return backend
@@ -0,0 +1,102 @@
+"""Frunk 启动入口。
+
+    python serve.py                       # 生产模式：gunicorn 多进程 + 多线程
+    python serve.py --workers 4 --threads 8 --port 5003
+    python serve.py --dev                 # Werkzeug 开发服务器（不开调试器）
+    python serve.py --debug               # 开发服务器 + 调试器/自动重载，仅限本机开发
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+class FrunkServer(BaseApplication):
+    def __init__(self, application, options: dict):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Frunk server")
+    parser.add_argument("--host", default=os.getenv("FRUNK_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("FRUNK_PORT", "5003")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("FRUNK_WORKERS", str(min(4, os.cpu_count() or 1))))
+    )
+    parser.add_argument("--threads", type=int, default=int(os.getenv("FRUNK_THREADS", "4")))
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("FRUNK_TIMEOUT", "60")))
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=int(os.getenv("FRUNK_GRACEFUL_TIMEOUT", "30"))
+    )
+    parser.add_argument("--skip-init", action="store_true", help="skip schema setup (already done)")
+    parser.add_argument("--dev", action="store_true", help="use the Werkzeug development server")
+    parser.add_argument("--debug", action="store_true", help="development server with debugger")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+
+    # 在 fork 之前导入并初始化一次：建表/迁移只在主进程跑，worker 直接继承已加载的应用
+    from app import app, init_db
+    from assets import init_assets
+    from extensions import db
+    from passwords import password_hasher
+    from tools.koculator import start_pool as start_koculator_pool
+
+    # 全文检索后端在创建应用时已按现有索引判定，--skip-init 也不影响写入时同步索引
+    if not args.skip_init:
+        init_db()
+        # 创建管理员时哈希密码会拉起进程池，fork 前关掉，worker 里用到时各自创建
+        password_hasher.shutdown()
+    if not (args.dev or args.debug):
+        # 开发模式直接读 frontend/ 源文件，改完刷新即可
+        init_assets(app)
+        print("✓ 静态资源构建完成")
+    with app.app_context():
+        # 主进程里用过的连接不能被多个 worker 共用（主库和各个只读副本）
+        for engine in db.engines.values():
+            engine.dispose()
+
+    def post_worker_init(worker):
+        # 批量计算的进程池在每个 worker 初始化后按应用配置启动，不在请求里临时创建
+        start_koculator_pool(app.config["KOCULATOR_BATCH_WORKERS"])
+
+    print(f"✓ 启动 Frunk: http://localhost:{args.port}")
+    if args.dev or args.debug:
+        start_koculator_pool(app.config["KOCULATOR_BATCH_WORKERS"])
+        app.run(debug=args.debug, host=args.host, port=args.port)
+        return 0
+
+    # SIGTERM 时 gunicorn 停止接新连接，等进行中的请求在 graceful_timeout 内处理完
+    FrunkServer(
+        app,
+        {
+            "bind": f"{args.host}:{args.port}",
+            "workers": args.workers,
+            "threads": args.threads,
+            "worker_class": "gthread",
+            "preload_app": True,
+            "timeout": args.timeout,
+            "graceful_timeout": args.graceful_timeout,
+            "accesslog": "-",
+            "post_worker_init": post_worker_init,
+        },
+    ).run()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from extensions import db
+from models import DailyStat, Note, PasswordResetRequest, StatCounter, User, UserStat
+
+# 汇总计数与按天计数桶：写路径在业务事务里增量更新，后台概览直接读，不做全表扫描。
+# 计数可能因为漏掉的写路径而漂移，rebuild_stats() 从业务表重新算一遍作为对账。
+USERS_TOTAL = "users_total"
+USERS_ACTIVE = "users_active"
+NOTES_TOTAL = "notes_total"
+RESETS_OPEN = "resets_open"
+COUNTERS = (USERS_TOTAL, USERS_ACTIVE, NOTES_TOTAL, RESETS_OPEN)
+
+NOTES_CREATED = "notes_created"
+USERS_REGISTERED = "users_registered"
+DAILY_METRICS = (NOTES_CREATED, USERS_REGISTERED)
+
+
+def _upsert_add(model, keys: dict, increments: dict, latest: dict | None = None) -> None:
+    """按主键累加若干列（行不存在就插入），一条语句完成，避免并发下先查后写。
+
+    latest 里的列取已有值与新值中较大的一个（如最近时间），None 表示不更新该列。
+    """
+    table = model.__table__
+    latest = {name: value for name, value in (latest or {}).items() if value is not None}
+    dialect = db.session.get_bind().dialect.name
+    values = {**keys, **increments, **latest}
+    updates = {name: table.c[name] + delta for name, delta in increments.items()}
+    for name, value in latest.items():
+        column = table.c[name]
+        updates[name] = case((column.is_(None) | (column < value), value), else_=column)
+    if dialect in {"sqlite", "postgresql"}:
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(table).values(**values)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=updates))
+    elif dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as upsert
+
+        db.session.execute(upsert(table).values(**values).on_duplicate_key_update(**updates))
+    else:
+        where = [table.c[name] == value for name, value in keys.items()]
+        if db.session.execute(update(table).where(*where).values(**updates)).rowcount == 0:
+            db.session.execute(insert(table).values(**values))
+
+
+def bump(key: str, delta: int = 1) -> None:
+    if delta:
+        _upsert_add(StatCounter, {"key": key}, {"value": delta})
+
+
+def bump_daily(metric: str, day: date, delta: int = 1) -> None:
+    if delta:
+        _upsert_add(DailyStat, {"day": day, "metric": metric}, {"value": delta})
+
+
+def user_registered(user: User) -> None:
+    bump(USERS_TOTAL)
+    if user.active is None or user.active:
+        bump(USERS_ACTIVE)
+    bump_daily(USERS_REGISTERED, (user.created_at or datetime.now()).date())
+
+
+def user_active_changed(active: bool) -> None:
+    bump(USERS_ACTIVE, 1 if active else -1)
+
+
+def notes_created(user_id: int, created_ats: list[datetime]) -> None:
+    if not created_ats:
+        return
+    bump(NOTES_TOTAL, len(created_ats))
+    for day, count in Counter(ts.date() for ts in created_ats if ts).items():
+        bump_daily(NOTES_CREATED, day, count)
+    last = max((ts for ts in created_ats if ts), default=None)
+    _upsert_add(UserStat, {"user_id": user_id}, {"note_count": len(created_ats)}, {"last_note_at": last})
+
+
+def notes_deleted(user_id: int, created_ats: list[datetime]) -> None:
+    # 按天的桶记的是“当天创建且仍存在”的笔记数，删除时从创建那天的桶里扣，和对账口径一致
+    if not created_ats:
+        return
+    bump(NOTES_TOTAL, -len(created_ats))
+    for day, count in Counter(ts.date() for ts in created_ats if ts).items():
+        bump_daily(NOTES_CREATED, day, -count)
+    _upsert_add(UserStat, {"user_id": user_id}, {"note_count": -len(created_ats)})
+
+
+def reset_requested() -> None:
+    bump(RESETS_OPEN)
+
+
+def _as_date(value) -> date:
+    # SQLite 的 date() 返回字符串，MySQL 返回 date
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild_stats() -> dict:
+    """对账：清空汇总表，从业务表重新统计。调用方负责提交。"""
+    db.session.execute(delete(StatCounter))
+    db.session.execute(delete(DailyStat))
+    db.session.execute(delete(UserStat))
+
+    counters = {
+        USERS_TOTAL: db.session.scalar(select(func.count(User.id))),
+        USERS_ACTIVE: db.session.scalar(select(func.count(User.id)).where(User.active.is_(True))),
+        NOTES_TOTAL: db.session.scalar(select(func.count(Note.id))),
+        RESETS_OPEN: db.session.scalar(
+            select(func.count(PasswordResetRequest.id)).where(PasswordResetRequest.status == "pending")
+        ),
+    }
+    db.session.execute(insert(StatCounter), [{"key": k, "value": v or 0} for k, v in counters.items()])
+
+    daily = []
+    for metric, column in ((NOTES_CREATED, Note.created_at), (USERS_REGISTERED, User.created_at)):
+        day = func.date(column)
+        rows = db.session.execute(select(day, func.count()).where(column.is_not(None)).group_by(day))
+        daily += [{"day": _as_date(d), "metric": metric, "value": n} for d, n in rows]
+    if daily:
+        db.session.execute(insert(DailyStat), daily)
+
+    users = [
+        {"user_id": uid, "note_count": n, "last_note_at": last}
+        for uid, n, last in db.session.execute(
+            select(Note.user_id, func.count(Note.id), func.max(Note.created_at)).group_by(Note.user_id)
+        )
+    ]
+    if users:
+        db.session.execute(insert(UserStat), users)
+    return counters
+
+
+def ensure_stats() -> None:
+    # 首次部署（汇总表为空）时做一次全量统计
+    if db.session.scalar(select(func.count()).select_from(StatCounter)) == 0:
+        rebuild_stats()
+        db.session.commit()
+
+
+def overview(days: int = 30, top: int = 10) -> dict:
+    """后台概览：只读汇总表，查询量与数据规模无关。"""
+    counters = dict(db.session.execute(select(StatCounter.key, StatCounter.value)).tuples().all())
+
+    today = date.today()
+    start = today - timedelta(days=days - 1)
+    buckets = {
+        (d, m): v
+        for d, m, v in db.session.execute(
+            select(DailyStat.day, DailyStat.metric, DailyStat.value).where(DailyStat.day >= start)
+        )
+    }
+    per_day = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        per_day.append({"day": day.isoformat(), **{m: buckets.get((day, m), 0) for m in DAILY_METRICS}})
+
+    top_users = [
+        {
+            "id": uid,
+            "email": email,
+            "note_count": n,
+            "last_note_at": last.isoformat() if last else None,
+        }
+        for uid, email, n, last in db.session.execute(
+            select(UserStat.user_id, User.email, UserStat.note_count, UserStat.last_note_at)
+            .join(User, User.id == UserStat.user_id)
+            .where(UserStat.note_count > 0)
+            .order_by(UserStat.note_count.desc())
+            .limit(top)
+        )
+    ]
+    return {
+        **{key: counters.get(key, 0) for key in COUNTERS},
+        "daily": per_day,
+        "top_users": top_users,
+    }
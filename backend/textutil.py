@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import hashlib
+import html
+import re
+
+TAG_RE = re.compile(r"<[^>]+>")
+SPACE_RE = re.compile(r"\s+")
+
+EXCERPT_LENGTH = 200
+
+
+def strip_html(value: str | None) -> str:
+    if not value:
+        return ""
+    plain = html.unescape(TAG_RE.sub(" ", value))
+    return SPACE_RE.sub(" ", plain).strip()
+
+
+def make_excerpt(value: str | None, length: int = EXCERPT_LENGTH) -> str:
+    plain = strip_html(value)
+    if len(plain) <= length:
+        return plain
+    return plain[: length - 1] + "…"
+
+
+def content_hash(value: str | None) -> str:
+    return hashlib.sha1((value or "").encode("utf-8")).hexdigest()
+
+
+def apply_text_diff(value: str, ops) -> str:
+    """按顺序应用 [{"pos", "delete", "insert"}] 形式的编辑，位置按 Unicode 码点计。"""
+    if not isinstance(ops, list):
+        raise ValueError("Invalid diff")
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError("Invalid diff")
+        pos = op.get("pos")
+        delete = op.get("delete", 0)
+        insert = op.get("insert", "")
+        if (
+            not isinstance(pos, int)
+            or not isinstance(delete, int)
+            or not isinstance(insert, str)
+            or pos < 0
+            or delete < 0
+            or pos + delete > len(value)
+        ):
+            raise ValueError("Invalid diff")
+        value = value[:pos] + insert + value[pos + delete :]
+    return value
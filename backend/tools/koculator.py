@@ -1,44 +1,141 @@
 from __future__ import annotations
 
+import math
+import os
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import (
+    ROUND_HALF_UP,
+    Context,
+    Decimal,
+    DivisionByZero,
+    InvalidOperation,
+    Overflow,
+    getcontext,
+    setcontext,
+)
+from functools import cached_property, lru_cache
 from typing import List
 
 from flask import jsonify
 
 
 class CalcError(Exception):
-    pass
-
-
-@dataclass
+    def __init__(self, message: str, code: str = "invalid_expression"):
+        super().__init__(message)
+        self.code = code
+
+
+@dataclass(frozen=True)
+class Limits:
+    """单个表达式的计算成本上限，全部在分词阶段（求值之前）检查。"""
+
+    max_length: int = 1000
+    max_tokens: int = 500
+    max_depth: int = 50
+    max_operand_digits: int = 50
+    # Decimal 运算精度（有效位数）与指数上限；超出指数范围报 result_too_large
+    precision: int = 28
+    max_exponent: int = 100
+
+    @cached_property
+    def context(self) -> Context:
+        # 各线程求值时用的是它的副本（见 _thread_context），这里的实例只当模板用
+        return Context(
+            prec=self.precision,
+            Emax=self.max_exponent,
+            Emin=-self.max_exponent - self.precision,
+            traps=[Overflow, InvalidOperation, DivisionByZero],
+        )
+
+
+# 基准 / fuzz 脚本用：不限制规模，精度和指数范围与 decimal 的默认上下文一致。
+# 指数上限不要再往大调：libmpdec 在 Emax 接近 MAX_EMAX 时每次运算都明显变慢，基准就不再反映引擎本身
+UNLIMITED = Limits(
+    max_length=sys.maxsize,
+    max_tokens=sys.maxsize,
+    max_depth=sys.maxsize,
+    max_operand_digits=sys.maxsize,
+    max_exponent=999999,
+)
+
+_limits = Limits()
+_rejections: Counter = Counter()
+_rejections_lock = threading.Lock()
+
+
+OPERATORS = frozenset({"+", "-", "*", "/", "u-"})
+PRECEDENCE = {
+    "+": 1,
+    "-": 1,
+    "*": 2,
+    "/": 2,
+    "u-": 3,
+}
+
+# 编译缓存（表达式 -> 后缀程序）和结果缓存（纯四则运算表达式 -> 结果）的默认容量
+DEFAULT_CACHE_SIZE = 1024
+_cache_size = DEFAULT_CACHE_SIZE
+
+
+@dataclass(frozen=True)
 class Token:
     value: str
 
     @property
     def is_operator(self) -> bool:
-        return self.value in {"+", "-", "*", "/", "u-"}
+        return self.value in OPERATORS
 
     @property
     def is_number(self) -> bool:
-        return not self.is_operator and self.value not in {"(", ")"}
+        # 变量也是操作数
+        return self.value not in OPERATORS and self.value not in {"(", ")"}
+
+    @property
+    def is_variable(self) -> bool:
+        return self.value not in OPERATORS and is_name_start(self.value[0])
+
 
+def is_name_start(char: str) -> bool:
+    return char.isascii() and (char.isalpha() or char == "_")
 
-def tokenize(expr: str) -> List[Token]:
+
+def check_operand(number: str, limits: Limits) -> None:
+    # 有效位数不会超过字符数，短数字（绝大多数）不用再去掉前导零和小数点来数
+    if len(number) <= limits.max_operand_digits:
+        return
+    digits = len(number.lstrip("0.").replace(".", ""))
+    if digits > limits.max_operand_digits:
+        raise CalcError("Operand too large", "operand_too_large")
+
+
+def tokenize(expr: str, limits: Limits | None = None) -> List[Token]:
+    limits = limits or _limits
     if not expr or expr.strip() == "":
         raise CalcError("Empty expression")
+    if len(expr) > limits.max_length:
+        raise CalcError("Expression too long", "expr_too_long")
 
     tokens: List[Token] = []
     number = ""
-
-    def push_number() -> None:
-        nonlocal number
-        if number == "":
-            return
-        tokens.append(Token(number))
-        number = ""
+    name = ""
+    depth = 0
+    max_tokens = limits.max_tokens
+    # 上一个 token 的类别：None / "num" / "op" / "(" / ")"，避免为了判断类别反复构造 Token
+    prev = None
 
     for char in expr:
+        if name:
+            if char.isascii() and (char.isalnum() or char == "_"):
+                name += char
+                continue
+            tokens.append(Token(name))
+            name = ""
+            prev = "num"
+
         if char.isdigit() or char == ".":
             if char == "." and "." in number:
                 raise CalcError("Invalid number format")
@@ -50,42 +147,67 @@ def tokenize(expr: str) -> List[Token]:
         if char.isspace():
             continue
 
-        if char in {"(", ")"}:
-            push_number()
-            prev = tokens[-1].value if tokens else None
-            if char == "(":
-                if prev and (Token(prev).is_number or prev == ")"):
-                    raise CalcError("Invalid operator sequence")
-                tokens.append(Token(char))
-                continue
-
-            if not prev or Token(prev).is_operator or prev == "(":
+        if is_name_start(char):
+            if number or prev == "num" or prev == ")":
                 raise CalcError("Invalid operator sequence")
-            tokens.append(Token(char))
+            name = char
             continue
 
-        if char in {"+", "-", "*", "/"}:
-            push_number()
-            prev = tokens[-1].value if tokens else None
-            if char == "-" and (not prev or Token(prev).is_operator or prev == "("):
-                tokens.append(Token("u-"))
-                continue
+        if number:
+            check_operand(number, limits)
+            tokens.append(Token(number))
+            number = ""
+            prev = "num"
 
-            if not prev or Token(prev).is_operator or prev == "(":
+        # token 数只在运算符和括号处检查：两个操作数不能直接相邻，中途最多多出两个，
+        # 结尾还有一次精确检查；不必每个字符都查一次
+        if len(tokens) > max_tokens:
+            raise CalcError("Too many tokens", "too_many_tokens")
+
+        if char == "(":
+            if prev == "num" or prev == ")":
                 raise CalcError("Invalid operator sequence")
+            depth += 1
+            if depth > limits.max_depth:
+                raise CalcError("Expression nested too deeply", "nesting_too_deep")
+            tokens.append(Token(char))
+            prev = "("
+            continue
 
+        if char == ")":
+            if prev is None or prev == "op" or prev == "(":
+                raise CalcError("Invalid operator sequence")
+            depth -= 1
             tokens.append(Token(char))
+            prev = ")"
+            continue
+
+        if char in "+-*/":
+            if prev is None or prev == "op" or prev == "(":
+                if char != "-":
+                    raise CalcError("Invalid operator sequence")
+                tokens.append(Token("u-"))
+            else:
+                tokens.append(Token(char))
+            prev = "op"
             continue
 
         raise CalcError("Invalid character")
 
-    push_number()
+    if number:
+        check_operand(number, limits)
+        tokens.append(Token(number))
+        prev = "num"
+    if name:
+        tokens.append(Token(name))
+        prev = "num"
 
+    if len(tokens) > max_tokens:
+        raise CalcError("Too many tokens", "too_many_tokens")
     if not tokens:
         raise CalcError("Empty expression")
 
-    last = tokens[-1].value
-    if Token(last).is_operator or last == "(":
+    if prev == "op" or prev == "(":
         raise CalcError("Invalid operator sequence")
 
     return tokens
@@ -94,13 +216,7 @@ def tokenize(expr: str) -> List[Token]:
 def to_postfix(tokens: List[Token]) -> List[Token]:
     output: List[Token] = []
     stack: List[Token] = []
-    precedence = {
-        "+": 1,
-        "-": 1,
-        "*": 2,
-        "/": 2,
-        "u-": 3,
-    }
+    precedence = PRECEDENCE
 
     for token in tokens:
         if token.is_number:
@@ -145,10 +261,46 @@ def to_postfix(tokens: List[Token]) -> List[Token]:
     return output
 
 
-def evaluate_postfix(tokens: List[Token]) -> Decimal:
+def evaluate_postfix(
+    tokens: List[Token],
+    variables: dict[str, Decimal] | None = None,
+    limits: Limits | None = None,
+) -> Decimal:
+    previous = getcontext()
+    setcontext(_thread_context(limits or _limits))
+    try:
+        return _run_postfix(tokens, variables)
+    except Overflow as exc:
+        raise CalcError("Result too large", "result_too_large") from exc
+    except InvalidOperation as exc:
+        raise CalcError("Invalid expression") from exc
+    finally:
+        setcontext(previous)
+
+
+_contexts = threading.local()
+
+
+def _thread_context(limits: Limits) -> Context:
+    # localcontext() 每次求值都要复制一份 Context，短表达式上这是大头；
+    # 改为每个线程按当前上限缓存一份副本，求值时直接切换过去
+    entry = getattr(_contexts, "entry", None)
+    if entry is None or entry[0] is not limits:
+        entry = (limits, limits.context.copy())
+        _contexts.entry = entry
+    return entry[1]
+
+
+def _run_postfix(tokens: List[Token], variables: dict[str, Decimal] | None) -> Decimal:
     stack: List[Decimal] = []
 
     for token in tokens:
+        if token.is_variable:
+            if not variables or token.value not in variables:
+                raise CalcError(f"Unknown variable: {token.value}")
+            stack.append(variables[token.value])
+            continue
+
         if token.is_number:
             try:
                 stack.append(Decimal(token.value))
@@ -176,7 +328,7 @@ def evaluate_postfix(tokens: List[Token]) -> Decimal:
             stack.append(left * right)
         elif token.value == "/":
             if right == 0:
-                raise CalcError("Cannot divide by zero")
+                raise CalcError("Cannot divide by zero", "div_by_zero")
             stack.append(left / right)
         else:
             raise CalcError("Invalid expression")
@@ -188,7 +340,9 @@ def evaluate_postfix(tokens: List[Token]) -> Decimal:
 
 
 def format_result(value: Decimal) -> float | int | str:
-    quantized = value.quantize(Decimal("1.000000000000"), rounding=ROUND_HALF_UP)
+    # 整数部分超过默认 28 位精度时 quantize 会抛 InvalidOperation，按数值大小放宽精度
+    context = Context(prec=max(28, value.adjusted() + 14))
+    quantized = value.quantize(Decimal("1.000000000000"), rounding=ROUND_HALF_UP, context=context)
     text = format(quantized, "f")
     if "." in text:
         text = text.rstrip("0").rstrip(".")
@@ -202,12 +356,262 @@ def format_result(value: Decimal) -> float | int | str:
         return text
 
 
-def calc_expr(expr: str):
+def normalize_expr(expr: str) -> str:
+    # 分词时空白本来就被忽略（包括数字中间的空白），去掉后语义不变；
+    # 但变量名靠空白分隔，含变量时保留单个空格
+    parts = expr.split()
+    if any(is_name_start(char) for char in expr):
+        return " ".join(parts)
+    return "".join(parts)
+
+
+@lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _compile_cached(key: str) -> tuple[tuple[Token, ...], tuple[str, str] | None]:
+    # 缓存 (message, code) 而不是异常对象，避免把 traceback 一起留在缓存里
     try:
-        tokens = tokenize(expr)
-        postfix = to_postfix(tokens)
-        result = evaluate_postfix(postfix)
-        return jsonify({"ok": True, "result": format_result(result)}), 200
+        return tuple(to_postfix(tokenize(key))), None
     except CalcError as exc:
-        return jsonify({"ok": False, "error": str(exc)}), 400
+        return (), (str(exc), exc.code)
+
+
+def compile_expr(expr: str) -> tuple[Token, ...]:
+    expr = expr or ""
+    # 先看原始长度，超长输入不做规范化也不进缓存
+    if len(expr) > _limits.max_length:
+        raise CalcError("Expression too long", "expr_too_long")
+    program, error = _compile_cached(normalize_expr(expr))
+    if error:
+        raise CalcError(*error)
+    return program
+
+
+@lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _calc_cached(key: str) -> tuple[bool, float | int | str, str | None]:
+    # 只有纯数字运算的表达式才会走到这里，结果只取决于表达式本身，可以直接记忆
+    try:
+        return True, format_result(evaluate_postfix(list(compile_expr(key)))), None
+    except CalcError as exc:
+        return False, str(exc), exc.code
+
+
+def configure_cache(maxsize: int) -> None:
+    global _compile_cached, _calc_cached, _cache_size
+    _cache_size = maxsize
+    _compile_cached = lru_cache(maxsize=maxsize)(_compile_cached.__wrapped__)
+    _calc_cached = lru_cache(maxsize=maxsize)(_calc_cached.__wrapped__)
+
+
+def configure_limits(limits: Limits) -> None:
+    global _limits
+    _limits = limits
+    # 缓存里的结果是按旧上限算出来的
+    _compile_cached.cache_clear()
+    _calc_cached.cache_clear()
+
+
+def current_limits() -> Limits:
+    return _limits
+
+
+def record_rejections(codes) -> None:
+    codes = [code for code in codes if code]
+    if codes:
+        with _rejections_lock:
+            _rejections.update(codes)
 
+
+def rejection_stats() -> dict:
+    with _rejections_lock:
+        return dict(_rejections)
+
+
+def cache_stats() -> dict:
+    stats = {}
+    for name, func in (("compile", _compile_cached), ("result", _calc_cached)):
+        info = func.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+        }
+    return stats
+
+
+def _evaluate_one(expr: str) -> tuple[bool, float | int | str, str | None]:
+    if not isinstance(expr, str):
+        return False, "Invalid expression", "invalid_expression"
+    if len(expr) > _limits.max_length:
+        return False, "Expression too long", "expr_too_long"
+    return _calc_cached(normalize_expr(expr))
+
+
+def calc_value(expr: str) -> tuple[bool, float | int | str, str | None]:
+    ok, value, code = _evaluate_one(expr)
+    record_rejections([code])
+    return ok, value, code
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+
+
+def _init_worker(limits: Limits, cache_size: int) -> None:
+    # spawn/forkserver 启动的子进程不继承主进程的配置，按启动进程池时的上限和缓存容量重新设置
+    configure_cache(cache_size)
+    configure_limits(limits)
+
+
+def start_pool(workers: int) -> None:
+    """按当前的上限和缓存容量启动批量计算用的进程池（workers ≤ 1 时不启用）。
+
+    在进程启动阶段调用（gunicorn 在每个 worker 初始化后），不在请求线程里临时 fork。
+    """
+    global _pool, _pool_workers
+    shutdown_pool()
+    if workers > 1:
+        _pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(_limits, _cache_size)
+        )
+        _pool_workers = workers
+        # 先跑一个空任务把子进程拉起来，首个批量请求不用等进程启动
+        _pool.submit(int).result()
+
+
+def shutdown_pool() -> None:
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+    _pool_workers = 0
+
+
+def _forget_pool() -> None:
+    # fork 出来的子进程（如 gunicorn worker）不能复用父进程的进程池，需要时自己 start_pool
+    global _pool, _pool_workers
+    _pool = None
+    _pool_workers = 0
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def calc_many(exprs: list, parallel_threshold: int = 256) -> list:
+    """批量计算，结果与输入同序；每项单独成功或失败。
+
+    相同表达式只算一次；已 start_pool 且不同表达式数量达到阈值时分块交给进程池并行计算。
+    """
+    unique = list(dict.fromkeys(e if isinstance(e, str) else None for e in exprs))
+    pool = _pool
+    if pool is not None and len(unique) >= parallel_threshold:
+        chunksize = max(1, len(unique) // (_pool_workers * 4))
+        values = list(pool.map(_evaluate_one, unique, chunksize=chunksize))
+    else:
+        values = [_evaluate_one(e) for e in unique]
+    lookup = dict(zip(unique, values))
+
+    # 拒绝计数放在主进程里做，子进程里的计数器不会回传
+    results = []
+    codes = []
+    for e in exprs:
+        ok, value, code = lookup[e if isinstance(e, str) else None]
+        codes.append(code)
+        results.append({"ok": True, "result": value} if ok else {"ok": False, "error": value, "code": code})
+    record_rejections(codes)
+    return results
+
+
+def program_variables(program: tuple[Token, ...]) -> set[str]:
+    return {token.value for token in program if token.is_variable}
+
+
+def _vector_inputs(variables: dict, names: set[str]) -> tuple[dict, int]:
+    if not isinstance(variables, dict):
+        raise CalcError("Invalid variables")
+    missing = names - set(variables)
+    if missing:
+        raise CalcError(f"Unknown variable: {sorted(missing)[0]}")
+    columns = {name: variables[name] for name in names}
+    lengths = {len(col) for col in columns.values() if isinstance(col, list)}
+    if len(lengths) != 1 or any(not isinstance(col, list) for col in columns.values()):
+        raise CalcError("Variables must be arrays of the same length")
+    for col in columns.values():
+        if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in col):
+            raise CalcError("Variables must be numeric")
+        # json 能解析出 Infinity/NaN，这些值没法按精确小数计算
+        if any(isinstance(v, float) and not math.isfinite(v) for v in col):
+            raise CalcError("Variables must be finite numbers")
+    return columns, lengths.pop()
+
+
+def evaluate_vector(program: tuple[Token, ...], variables: dict) -> tuple[list, list]:
+    """用 NumPy 对整列数据跑一遍后缀程序，返回 (结果, 除零掩码)；除零的位置结果为 None。"""
+    import numpy as np
+
+    names = program_variables(program)
+    if not names:
+        raise CalcError("Expression has no variables")
+    columns, length = _vector_inputs(variables, names)
+    arrays = {name: np.asarray(col, dtype=np.float64) for name, col in columns.items()}
+
+    zero = np.zeros(length, dtype=bool)
+    stack = []
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for token in program:
+            if token.is_variable:
+                stack.append(arrays[token.value])
+            elif token.is_number:
+                stack.append(np.float64(token.value))
+            elif token.value == "u-":
+                if not stack:
+                    raise CalcError("Invalid expression")
+                stack.append(np.negative(stack.pop()))
+            else:
+                if len(stack) < 2:
+                    raise CalcError("Invalid expression")
+                right = stack.pop()
+                left = stack.pop()
+                if token.value == "+":
+                    stack.append(left + right)
+                elif token.value == "-":
+                    stack.append(left - right)
+                elif token.value == "*":
+                    stack.append(left * right)
+                else:
+                    zero |= np.broadcast_to(right == 0, (length,))
+                    stack.append(left / right)
+
+    if len(stack) != 1:
+        raise CalcError("Invalid expression")
+    result = np.broadcast_to(stack[0], (length,))
+    invalid = zero | ~np.isfinite(result)
+    values = [None if bad else value for value, bad in zip(result.tolist(), invalid.tolist())]
+    return values, zero.tolist()
+
+
+def evaluate_exact(program: tuple[Token, ...], variables: dict) -> tuple[list, list]:
+    # 逐行用 Decimal 计算，保留 format_result 的舍入规则
+    names = program_variables(program)
+    columns, length = _vector_inputs(variables, names) if names else ({}, 1)
+    tokens = list(program)
+    values, zero = [], []
+    for i in range(length):
+        row = {name: Decimal(str(col[i])) for name, col in columns.items()}
+        try:
+            values.append(format_result(evaluate_postfix(tokens, row)))
+            zero.append(False)
+        except CalcError as exc:
+            if exc.code != "div_by_zero":
+                raise
+            values.append(None)
+            zero.append(True)
+    return values, zero
+
+
+def calc_expr(expr: str):
+    ok, value, code = calc_value(expr)
+    if ok:
+        return jsonify({"ok": True, "result": value}), 200
+    return jsonify({"ok": False, "error": value, "code": code}), 400
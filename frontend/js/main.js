@@ -20,8 +20,12 @@ const app = createApp({
       resetStatus: "",
       announcements: [],
       adminAnnouncements: [],
+      adminAnnouncementsCursor: null,
       adminUsers: [],
+      adminUserFilter: { q: "", role: "", active: "" },
+      adminUsersCursor: null,
       resetRequests: [],
+      resetRequestsCursor: null,
       profileForm: { display_name: "", phone: "", bio: "", avatar_url: "" },
       passwordForm: { current: "", next: "" },
       emailForm: { email: "", current: "" },
@@ -133,8 +137,17 @@ const app = createApp({
       this.draftEditor = null;
     },
 
-    startEdit(note) {
+    async startEdit(note) {
+      if (note.content === undefined) {
+        const res = await this._get("/notes/" + note.id);
+        note.content = res.note.content;
+      }
       note.isEditing = true;
+      // 先记下服务器上的原始内容：增量保存的 diff 以它为基准，旧的纯文本笔记转成 HTML 后也一样
+      if (note.savedContent === undefined) {
+        note.savedTitle = note.title;
+        note.savedContent = note.content;
+      }
       if (note.content && !this.isHtmlContent(note.content)) {
         note.content = this.textToHtml(note.content);
       }
@@ -270,8 +283,11 @@ const app = createApp({
       this.tags = [];
       this.announcements = [];
       this.adminAnnouncements = [];
+      this.adminAnnouncementsCursor = null;
       this.adminUsers = [];
+      this.adminUsersCursor = null;
       this.resetRequests = [];
+      this.resetRequestsCursor = null;
       this.profileForm = { display_name: "", phone: "", bio: "", avatar_url: "" };
       this.passwordForm = { current: "", next: "" };
       this.emailForm = { email: "", current: "" };
@@ -293,17 +309,33 @@ const app = createApp({
       const res = await this._get("/announcements/").catch(() => ({ announcements: [] }));
       this.announcements = res.announcements || [];
     },
-    async loadAdminAnnouncements() {
-      const res = await this._get("/admin/announcements").catch(() => ({ announcements: [] }));
-      this.adminAnnouncements = res.announcements || [];
-    },
-    async loadAdminUsers() {
-      const res = await this._get("/admin/users").catch(() => ({ users: [] }));
-      this.adminUsers = (res.users || []).map((user) => ({ ...user, newPassword: "" }));
-    },
-    async loadResetRequests() {
-      const res = await this._get("/admin/password-resets").catch(() => ({ resets: [] }));
-      this.resetRequests = res.resets || [];
+    async loadAdminAnnouncements(more = false) {
+      const params = new URLSearchParams();
+      if (more && this.adminAnnouncementsCursor) params.set("cursor", this.adminAnnouncementsCursor);
+      const res = await this._get("/admin/announcements?" + params).catch(() => ({ announcements: [] }));
+      const announcements = res.announcements || [];
+      this.adminAnnouncements = more ? this.adminAnnouncements.concat(announcements) : announcements;
+      this.adminAnnouncementsCursor = res.next_cursor || null;
+    },
+    async loadAdminUsers(more = false) {
+      // 服务端分页：more 为 true 时接着上一页的游标往后加载
+      const params = new URLSearchParams({ with_stats: "1" });
+      for (const [key, value] of Object.entries(this.adminUserFilter)) {
+        if (value !== "") params.set(key, value);
+      }
+      if (more && this.adminUsersCursor) params.set("cursor", this.adminUsersCursor);
+      const res = await this._get("/admin/users?" + params).catch(() => ({ users: [] }));
+      const users = (res.users || []).map((user) => ({ ...user, newPassword: "" }));
+      this.adminUsers = more ? this.adminUsers.concat(users) : users;
+      this.adminUsersCursor = res.next_cursor || null;
+    },
+    async loadResetRequests(more = false) {
+      const params = new URLSearchParams();
+      if (more && this.resetRequestsCursor) params.set("cursor", this.resetRequestsCursor);
+      const res = await this._get("/admin/password-resets?" + params).catch(() => ({ resets: [] }));
+      const resets = res.resets || [];
+      this.resetRequests = more ? this.resetRequests.concat(resets) : resets;
+      this.resetRequestsCursor = res.next_cursor || null;
     },
     async loadProfile() {
       const res = await this._get("/profile/").catch(() => ({ profile: {} }));
@@ -334,12 +366,20 @@ const app = createApp({
         this.err = "头像请小于 2MB";
         return;
       }
-      const reader = new FileReader();
-      reader.onload = async () => {
-        this.profileForm.avatar_url = String(reader.result || "");
-        await this.saveProfile();
-      };
-      reader.readAsDataURL(file);
+      this.err = "";
+      const body = new FormData();
+      body.append("avatar", file);
+      const r = await fetch(this.api + "/profile/avatar", {
+        method: "POST",
+        body,
+        credentials: "include",
+      });
+      const res = await r.json().catch(() => ({}));
+      if (!r.ok) {
+        this.err = res.error || "头像上传失败";
+        return;
+      }
+      this.profileForm.avatar_url = res.avatar_url;
     },
     async changeEmail() {
       this.err = "";
@@ -478,6 +518,7 @@ const app = createApp({
       if (this.selectedTagId) params.append("tag_id", this.selectedTagId);
       params.append("page", this.pagination.page);
       params.append("per_page", this.pagination.per_page);
+      params.append("view", "summary");
       if (params.toString()) url += "?" + params.toString();
       const response = await this._get(url);
       this.notes = (response.notes || []).map((note) => ({
@@ -502,7 +543,66 @@ const app = createApp({
     },
     scheduleUpdate(note) {
       if (this.updateTimers[note.id]) clearTimeout(this.updateTimers[note.id]);
-      this.updateTimers[note.id] = setTimeout(() => this.updateNote(note), 500);
+      const save = note.savedContent === undefined ? this.updateNote : this.patchNote;
+      this.updateTimers[note.id] = setTimeout(() => save(note), 500);
+    },
+    textDiff(before, after) {
+      // 按码点比较公共前后缀，得到一次替换；与后端 content_diff 的位置语义一致
+      const a = Array.from(before || "");
+      const b = Array.from(after || "");
+      let start = 0;
+      while (start < a.length && start < b.length && a[start] === b[start]) start++;
+      let endA = a.length;
+      let endB = b.length;
+      while (endA > start && endB > start && a[endA - 1] === b[endB - 1]) {
+        endA--;
+        endB--;
+      }
+      return { pos: start, delete: endA - start, insert: b.slice(start, endB).join("") };
+    },
+    async contentHash(text) {
+      // 与后端 textutil.content_hash 一致：UTF-8 的 SHA-1 十六进制
+      const digest = await window.crypto.subtle.digest("SHA-1", new TextEncoder().encode(text || ""));
+      return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+    },
+    async patchNote(n) {
+      // 非安全上下文（非 localhost 的 http）没有 crypto.subtle，无法校验，改为整篇保存
+      if (!window.crypto?.subtle) return this.updateNote(n);
+      const title = n.title;
+      const content = n.content;
+      const payload = { version: n.version };
+      if (title !== n.savedTitle) payload.title = title;
+      if (content !== n.savedContent) {
+        payload.content_diff = [this.textDiff(n.savedContent, content)];
+        // 服务器按 diff 拼出的内容与本地不一致时拒绝，而不是静默写坏
+        payload.content_hash = await this.contentHash(content);
+      }
+      if (!("title" in payload) && !("content_diff" in payload)) return;
+
+      n.updating = true;
+      try {
+        const response = await this._patch("/notes/" + n.id, payload);
+        n.version = response.version;
+        n.updated_at = response.updated_at;
+        n.savedTitle = title;
+        n.savedContent = content;
+        n.justSaved = true;
+        setTimeout(() => (n.justSaved = false), 2000);
+      } catch (e) {
+        if (e.status !== 409) throw e;
+        if (e.message === "Content hash mismatch") {
+          // 本地记的基准与服务器不一致：改为整篇保存，保留当前编辑
+          return await this.updateNote(n);
+        }
+        // 其他地方改过这条笔记：以服务器为准重新加载
+        this.err = "笔记已在其他地方修改，已重新加载";
+        const res = await this._get("/notes/" + n.id);
+        Object.assign(n, res.note, { savedTitle: res.note.title, savedContent: res.note.content });
+        const editor = window.tinymce?.get("note-editor-" + n.id);
+        if (editor) editor.setContent(n.content || "");
+      } finally {
+        n.updating = false;
+      }
     },
     async updateNote(n) {
       n.updating = true;
@@ -516,6 +616,11 @@ const app = createApp({
         if (response.note) {
           n.updated_at = response.note.updated_at;
           n.tags = response.note.tags;
+          n.version = response.note.version;
+          if (n.savedContent !== undefined) {
+            n.savedTitle = updateData.title;
+            n.savedContent = updateData.content;
+          }
         }
         n.justSaved = true;
         setTimeout(() => (n.justSaved = false), 2000);
@@ -731,6 +836,20 @@ const app = createApp({
       if (!r.ok) throw new Error(await r.text());
       return r.json();
     },
+    async _patch(p, data) {
+      const r = await fetch(this.api + p, {
+        method: "PATCH",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(data),
+        credentials: "include",
+      });
+      if (!r.ok) {
+        const error = new Error((await r.json().catch(() => ({}))).error || "error");
+        error.status = r.status;
+        throw error;
+      }
+      return r.json();
+    },
     async _del(p) {
       const r = await fetch(this.api + p, {
         method: "DELETE",